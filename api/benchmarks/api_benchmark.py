@@ -0,0 +1,357 @@
+"""Measures the latency percentiles, throughput and peak memory of the API's routes.
+
+For each dataset size, a SQLite database is seeded with db.generate (same seed, same
+rows) and every scenario is driven against two targets, each on its own copy of it:
+
+    inprocess   a TestClient in a child process, no network or server in the way
+    uvicorn     a local uvicorn server, over HTTP
+
+One JSON object is printed per size and target, with p50/p95/p99 latency, throughput and
+errors per scenario, the peak RSS of the process serving the requests and the commit that
+was measured, so runs can be appended to a file and compared over time. Run from the api
+directory:
+
+    python benchmarks/api_benchmark.py --statlines 10000 100000 --requests 200 >> runs.jsonl
+
+Settings of the app are read from the environment and passed on, e.g. CACHE_MAX_ENTRIES=0
+benchmarks the routes without their response cache or STATS_SNAPSHOT=true with it.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ["inprocess", "uvicorn"]
+SERVER_START_TIMEOUT = 120
+
+
+# === Scenarios ===
+# (name, method, path, body) where the path is formatted with the fixtures and the body is
+# built for the i-th request of the scenario, so that writes never collide. The API has no
+# way to attribute a new stat line to a player, so POST /stats/ and /stats/bulk only touch
+# the team, season and game rollups; PATCH edits a generated line of a player and is the
+# write that covers PlayerRollup and the player cache keys
+def _statline(fixtures: dict, i: int) -> dict:
+    return {
+        "date": fixtures["date"],
+        "team": "Christopher Newport University",
+        "opponent": fixtures["team"],
+        "season": fixtures["season"],
+        "fgm": i % 10,
+        "fga": 10,
+        "pts": 2 * (i % 10),
+    }
+
+
+def _gamestat(fixtures: dict, i: int) -> dict:
+    # GameStat.date is unique, so every request posts a game on a day of its own
+    date = datetime.date(2100, 1, 1) + datetime.timedelta(days=fixtures["run"] + i)
+    gamestat = {field: 1 for field in fixtures["gamestat_fields"]}
+    gamestat.update(
+        date=date.isoformat(),
+        opponent=fixtures["team"],
+        season=f"{date.year}-{date.year + 1}",
+        year=date.year,
+        month=date.month,
+        day=date.day,
+        weekday=date.weekday(),
+    )
+    return gamestat
+
+
+SCENARIOS = [
+    ("stats_player", "GET", "/stats/player", None),
+    ("stats_team", "GET", "/stats/teams/{team}", None),
+    ("stats_games", "GET", "/stats/games", None),
+    ("stats_game", "GET", "/stats/games/{date}", None),
+    ("stats_page", "GET", "/stats/?limit=100", None),
+    ("gamestats_page", "GET", "/gamestats/?limit=100", None),
+    ("players", "GET", "/players/", None),
+    ("create_statline", "POST", "/stats/", _statline),
+    (
+        "bulk_statlines",
+        "POST",
+        "/stats/bulk",
+        lambda fixtures, i: [_statline(fixtures, i * 10 + j) for j in range(10)],
+    ),
+    ("update_statline", "PATCH", "/stats/{statline_id}", lambda _, i: {"pts": i}),
+    ("create_gamestat", "POST", "/gamestats/", _gamestat),
+]
+
+
+def load_fixtures(client) -> dict:
+    """Picks the ids and names the scenarios' paths and bodies are built from."""
+    statline = client.get("/stats/?limit=1").json()["data"][0]
+    gamestat = client.get("/gamestats/?limit=1").json()["data"][0]
+    return {
+        "team": statline["opponent"],
+        "date": statline["date"],
+        "season": statline["season"],
+        "statline_id": statline["id"],
+        "gamestat_fields": [
+            field
+            for field, value in gamestat.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ],
+        "run": 0,
+    }
+
+
+# === Measurement ===
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    milliseconds = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "max_ms": round(float(milliseconds.max()), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def run_scenario(client, scenario, fixtures: dict, requests: int, concurrency: int):
+    """Sends the scenario's requests from `concurrency` threads and times each of them.
+
+    A few warm-up requests are sent first and not counted, so connection setup, imports
+    and the first fill of the response cache don't land in the percentiles.
+    """
+    name, method, path, body = scenario
+    path = path.format(**fixtures)
+
+    def send(i: int):
+        json_body = None if body is None else body(fixtures, i)
+        began = time.perf_counter()
+        response = client.request(method, path, json=json_body)
+        return time.perf_counter() - began, response.status_code >= 400
+
+    warmup = min(requests, max(concurrency, 5))
+    for i in range(warmup):
+        send(i)
+    began = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(send, range(warmup, warmup + requests)))
+    elapsed = time.perf_counter() - began
+    fixtures["run"] += warmup + requests
+
+    latencies = [latency for latency, _ in results]
+    errors = sum(failed for _, failed in results)
+    return {
+        "method": method,
+        "path": path,
+        **summarize(latencies, errors, elapsed),
+    }
+
+
+def run_scenarios(client, requests: int, concurrency: int) -> dict:
+    fixtures = load_fixtures(client)
+    return {
+        scenario[0]: run_scenario(client, scenario, fixtures, requests, concurrency)
+        for scenario in SCENARIOS
+    }
+
+
+def peak_rss_mb(pid: int = None):
+    """Returns the peak resident memory of a process in MB, this one if pid is None."""
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # Only Linux reports the peak memory of another process
+    return None
+
+
+# === Targets ===
+def app_environment(database: str, directory: str) -> dict:
+    environment = dict(os.environ)
+    environment.pop("ENVIRONMENT", None)
+    environment.update(
+        DATABASE_URL=f"sqlite:///{database}",
+        FEATURES_CACHE_DIR=os.path.join(directory, "features_cache"),
+    )
+    return environment
+
+
+def run_inprocess(database: str, directory: str, arguments) -> dict:
+    """Runs the scenarios in a child process so its peak RSS is that of this size only."""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        "--requests",
+        str(arguments.requests),
+        "--concurrency",
+        str(arguments.concurrency),
+    ]
+    output = subprocess.run(
+        command,
+        cwd=directory,
+        env=app_environment(database, directory),
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def worker(arguments):
+    sys.path.insert(0, API_DIRECTORY)
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        routes = run_scenarios(client, arguments.requests, arguments.concurrency)
+    print(json.dumps({"peak_rss_mb": peak_rss_mb(), "routes": routes}), flush=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_uvicorn(database: str, directory: str, arguments) -> dict:
+    import httpx
+
+    port = free_port()
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "main:app",
+        "--app-dir",
+        API_DIRECTORY,
+        "--port",
+        str(port),
+        "--log-level",
+        "warning",
+    ]
+    server = subprocess.Popen(
+        command, cwd=directory, env=app_environment(database, directory)
+    )
+    try:
+        limits = httpx.Limits(max_connections=arguments.concurrency)
+        with httpx.Client(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            deadline = time.monotonic() + SERVER_START_TIMEOUT
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before serving requests")
+                try:
+                    client.get("/")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+            routes = run_scenarios(client, arguments.requests, arguments.concurrency)
+        return {"peak_rss_mb": peak_rss_mb(server.pid), "routes": routes}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+RUNNERS = {"inprocess": run_inprocess, "uvicorn": run_uvicorn}
+
+
+# === Datasets ===
+def seed(database: str, statlines: int, seed: int, directory: str):
+    """Fills a new database with the generator's rows, as the CLI of db.generate does."""
+    command = [
+        sys.executable,
+        "-m",
+        "db.generate",
+        "--statlines",
+        str(statlines),
+        "--seed",
+        str(seed),
+    ]
+    environment = app_environment(database, directory)
+    subprocess.run(command, cwd=API_DIRECTORY, env=environment, check=True)
+
+
+def copy_database(source: str, destination: str):
+    # The backup API copies a consistent database whatever is left in the WAL file
+    with sqlite3.connect(source) as original, sqlite3.connect(destination) as copy:
+        original.backup(copy)
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=API_DIRECTORY,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(arguments):
+    directory = tempfile.mkdtemp()
+    try:
+        for statlines in arguments.statlines:
+            seeded = os.path.join(directory, f"seed-{statlines}.sqlite3")
+            seed(seeded, statlines, arguments.seed, directory)
+            for target in arguments.targets:
+                database = os.path.join(directory, f"{target}-{statlines}.sqlite3")
+                copy_database(seeded, database)
+                result = RUNNERS[target](database, directory, arguments)
+                print(
+                    json.dumps(
+                        {
+                            "timestamp": datetime.datetime.utcnow().isoformat(),
+                            "commit": commit(),
+                            "python": platform.python_version(),
+                            "target": target,
+                            "statlines": statlines,
+                            "seed": arguments.seed,
+                            "requests": arguments.requests,
+                            "concurrency": arguments.concurrency,
+                            **result,
+                        }
+                    ),
+                    flush=True,
+                )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--statlines", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.worker:
+        worker(arguments)
+    else:
+        benchmark(arguments)
@@ -0,0 +1,103 @@
+"""Profiles the fast (Core rows + orjson) and ORM (jsonable_encoder) paths of the list endpoints.
+
+A temporary SQLite database is filled with random game stats and the whole history is read
+and serialized both ways, timing the query and the serialization separately. Run from
+the api directory:
+
+    python benchmarks/serialization_profile.py --rows 1000 10000 100000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORY, 'profile.sqlite3')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from sqlmodel import Session, delete, select  # noqa: E402
+from db.database import create_db_and_tables, engine  # noqa: E402
+from db.models import *  # noqa: E402
+
+INSERT_BATCH_SIZE = 10_000
+
+
+def fill(session: Session, rows: int, seed: int = 0):
+    """Replaces the game stats with `rows` random ones, one per day."""
+    rng = np.random.default_rng(seed)
+    session.exec(delete(GameStat))
+    session.commit()
+
+    fields = GameStatCreate.__fields__.values()
+    start = datetime.date(1900, 1, 1)
+    for offset in range(0, rows, INSERT_BATCH_SIZE):
+        records = []
+        for i in range(offset, min(offset + INSERT_BATCH_SIZE, rows)):
+            record = {
+                "id": uuid.uuid4(),
+                "created_on": datetime.datetime.utcnow(),
+                "last_modified": datetime.datetime.utcnow(),
+            }
+            for field in fields:
+                if field.type_ is int:
+                    record[field.name] = int(rng.integers(0, 100))
+                elif field.type_ is float:
+                    record[field.name] = float(rng.random())
+                elif field.type_ is str:
+                    record[field.name] = "Christopher Newport University"
+            record["date"] = start + datetime.timedelta(days=i)
+            records.append(record)
+        session.execute(GameStat.__table__.insert(), records)
+    session.commit()
+
+
+def timed(function):
+    began = time.perf_counter()
+    value = function()
+    return value, round((time.perf_counter() - began) * 1000, 3)
+
+
+def orm_path(session: Session):
+    """What the endpoints did before: ORM objects through jsonable_encoder and json.dumps."""
+    rows, query_ms = timed(lambda: session.exec(select(GameStat)).all())
+    body, serialize_ms = timed(
+        lambda: JSONResponse(jsonable_encoder({"data": rows})).body
+    )
+    return {"query_ms": query_ms, "serialize_ms": serialize_ms, "bytes": len(body)}
+
+
+def fast_path(session: Session):
+    """What the endpoints do now: Core rows zipped into dicts and encoded by orjson."""
+    result, query_ms = timed(lambda: session.execute(GameStat.__table__.select()).all())
+    columns = GameStat.__table__.columns.keys()
+    body, serialize_ms = timed(
+        lambda: ORJSONResponse(
+            {"data": [dict(zip(columns, row)) for row in result]}
+        ).body
+    )
+    return {"query_ms": query_ms, "serialize_ms": serialize_ms, "bytes": len(body)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    arguments = parser.parse_args()
+
+    create_db_and_tables()
+    for rows in arguments.rows:
+        with Session(engine) as session:
+            fill(session, rows)
+        # Fresh sessions so neither path is served from the other's identity map
+        with Session(engine) as session:
+            orm = orm_path(session)
+        with Session(engine) as session:
+            fast = fast_path(session)
+        print(json.dumps({"rows": rows, "orm": orm, "fast": fast}), flush=True)
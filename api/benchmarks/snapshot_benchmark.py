@@ -0,0 +1,131 @@
+"""Compares the columnar snapshot with the SQL paths of the /stats/* rollup endpoints.
+
+For each size, a temporary SQLite database is filled with random stat lines and every
+dimension is aggregated three ways: a GROUP BY over statLines, a read of the rollup
+table, and the snapshot. Run from the api directory:
+
+    python benchmarks/snapshot_benchmark.py --rows 10000 1000000 10000000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORY, 'benchmark.sqlite3')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import Session, delete, func, select  # noqa: E402
+from db.database import create_db_and_tables, engine  # noqa: E402
+from db.models import *  # noqa: E402
+from db.rollups import SUM_FIELDS, rebuild_rollups, rollup_columns  # noqa: E402
+from snapshot import DIMENSIONS, StatSnapshot  # noqa: E402
+
+INSERT_BATCH_SIZE = 100_000
+ROLLUPS = {
+    "player": PlayerRollup,
+    "opponent": TeamRollup,
+    "season": SeasonRollup,
+    "game": GameRollup,
+}
+
+
+def fill(session: Session, rows: int, seed: int = 0):
+    """Replaces the stat lines with `rows` random ones spread over 50 players and 20 seasons."""
+    rng = np.random.default_rng(seed)
+    session.exec(delete(StatLine))
+    session.commit()
+
+    player_ids = session.exec(select(Player.id)).all()
+    for _ in range(50 - len(player_ids)):
+        session.add(
+            Player(
+                full_name=uuid.uuid4().hex,
+                class_name=ClassEnum.senior,
+                position=PositionEnum.center,
+                height="6'8",
+                weight="230",
+                hometown_hs="Newport News, VA",
+                jersey_num=0,
+            )
+        )
+    session.commit()
+    player_ids = session.exec(select(Player.id)).all()
+    opponents = [f"Opponent {i}" for i in range(40)]
+    start = datetime.date(2000, 1, 1)
+
+    for offset in range(0, rows, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, rows - offset)
+        days = rng.integers(0, 20 * 365, count)
+        stats = {field: rng.integers(0, 20, count) for field in SUM_FIELDS}
+        records = [
+            {
+                "id": uuid.uuid4(),
+                "date": start + datetime.timedelta(days=int(days[i])),
+                "team": "Christopher Newport University",
+                "opponent": opponents[days[i] % len(opponents)],
+                "season": f"{2000 + days[i] // 365}-{2001 + days[i] // 365}",
+                "player_id": player_ids[i % len(player_ids)],
+                "created_on": datetime.datetime.utcnow(),
+                "last_modified": datetime.datetime.utcnow(),
+                **{field: int(stats[field][i]) for field in SUM_FIELDS},
+            }
+            for i in range(count)
+        ]
+        session.execute(StatLine.__table__.insert(), records)
+    session.commit()
+
+
+def timed(function, repeat: int = 3):
+    """Returns the best wall time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - began)
+    return round(best * 1000, 3)
+
+
+def group_by_statement(dimension: str):
+    column = getattr(StatLine, DIMENSIONS[dimension])
+    sums = [func.sum(getattr(StatLine, field)) for field in SUM_FIELDS]
+    return select(column, func.count(), *sums).group_by(column).order_by(column)
+
+
+def benchmark(rows: int):
+    with Session(engine) as session:
+        fill(session, rows)
+        rebuild_rollups(session)
+
+        snapshot = StatSnapshot()
+        result = {
+            "rows": rows,
+            "snapshot_load_ms": timed(lambda: snapshot.load(session), 1),
+        }
+        for dimension, model in ROLLUPS.items():
+            statement = group_by_statement(dimension)
+            rollup = select(*rollup_columns(model))
+            result[dimension] = {
+                "sql_group_by_ms": timed(lambda: session.execute(statement).all()),
+                "rollup_table_ms": timed(lambda: session.execute(rollup).all()),
+                "snapshot_ms": timed(lambda: snapshot.rows(dimension)),
+            }
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    arguments = parser.parse_args()
+
+    create_db_and_tables()
+    for rows in arguments.rows:
+        print(json.dumps(benchmark(rows)), flush=True)
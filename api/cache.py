@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 512))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 300))
+
+
+class ResponseCache:
+    """Bounded in-process cache of endpoint results with LRU eviction and a TTL.
+
+    Entries are keyed by a tuple of the endpoint's route and its path params, e.g.
+    ("/stats/teams/{team_name}", "Salisbury University"), so that writes can drop exactly
+    the entries they affect. The cache lives in the worker process, so each worker keeps
+    (and invalidates) its own copy. Each entry is stored with the data versions it was
+    built at and only returned to a request made at the same versions, so an entry built
+    before a write, whichever worker handled it, is never served after it.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        """Returns the cached value for the key, or None if it is missing, expired or was
+        built at other data versions."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_routes(self, *routes):
+        """Drops every entry of the given routes, whatever their path params."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in routes]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def statline_keys(statline) -> list:
+    """Returns the keys of every cached aggregate a stat line is counted in."""
+    return [
+        ("/stats/player",),
+        ("/stats/players/{player_id}", statline.player_id),
+        ("/stats/teams",),
+        ("/stats/teams/{team_name}", statline.opponent),
+        ("/stats/season",),
+        ("/stats/season/{season_year}", statline.season),
+        ("/stats/games",),
+        ("/stats/games/{game_date}", statline.date),
+    ]
+
+
+def player_keys(player) -> list:
+    """Returns the keys of every cached aggregate that shows a player's details."""
+    return [
+        ("/stats/player",),
+        ("/stats/players/{player_id}", player.id),
+    ]
+
+
+cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
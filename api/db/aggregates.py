@@ -0,0 +1,152 @@
+from types import SimpleNamespace
+from typing import List, Optional
+from sqlmodel import func, select
+from .models import *
+from .metrics import RATIOS, ratio_column, statline_sums
+from .rollups import STAT_FIELDS, SUM_FIELDS
+
+
+# Largest number of games a rolling window can span
+MAX_ROLLING_WINDOW = 100
+
+
+# Dimensions the stat lines can be grouped by, with the columns each one returns
+DIMENSIONS = {
+    "player": [StatLine.player_id, Player.full_name],
+    "opponent": [StatLine.opponent],
+    "season": [StatLine.season],
+    "game": [StatLine.date],
+}
+
+# Dimensions the stat lines can be filtered on, with the column and value parser of each
+FILTERS = {
+    "player": (StatLine.player_id, UUID),
+    "opponent": (StatLine.opponent, str),
+    "season": (StatLine.season, str),
+    "game": (StatLine.date, datetime.date.fromisoformat),
+}
+
+
+def aggregate_column(field: str):
+    """Returns the aggregate of a StatLine column labelled with the field name.
+
+    Counting stats are summed and ratios are computed from the sums (e.g. total makes over
+    total attempts), like the /stats/* endpoints do.
+
+    Args:
+        field (str): one of STAT_FIELDS
+    """
+    if field in RATIOS:
+        return ratio_column(field, statline_sums(SUM_FIELDS))
+    return func.sum(getattr(StatLine, field)).label(field)
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+def aggregate_statement(
+    group_by: Optional[str], fields: Optional[str], where: List[str]
+):
+    """Builds the select of an aggregation over the stat lines.
+
+    Only the requested fields are aggregated, and any number of dimensions can be grouped
+    on at once (e.g. player and season for each player's season totals).
+
+    Args:
+        group_by (str): comma separated dimensions to group by, all stat lines if None
+        fields (str): comma separated fields to aggregate, all STAT_FIELDS if None
+        where (List[str]): filters as `dimension:value` (e.g. `season:2012-2013`)
+
+    Raises:
+        ValueError: if a dimension, field or filter value is not valid
+    """
+    dimensions = _split(group_by)
+    fields = _split(fields) or STAT_FIELDS
+
+    unknown = [d for d in dimensions if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {', '.join(unknown)}")
+    unknown = [f for f in fields if f not in STAT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    group_columns = [column for d in dimensions for column in DIMENSIONS[d]]
+    statement = select(*group_columns, *[aggregate_column(f) for f in fields])
+    if "player" in dimensions:
+        statement = statement.join(Player)
+
+    for condition in where:
+        dimension, _, value = condition.partition(":")
+        if dimension not in FILTERS:
+            raise ValueError(f"Unknown where dimension: {dimension}")
+        column, parse = FILTERS[dimension]
+        try:
+            statement = statement.where(column == parse(value))
+        except ValueError:
+            raise ValueError(f"Invalid {dimension} in where: {value}")
+
+    return statement.group_by(*group_columns).order_by(*group_columns)
+
+
+def rolling_statement(
+    player_id: UUID,
+    fields: Optional[str],
+    window: int,
+    mode: RollingMode,
+    season: Optional[str] = None,
+):
+    """Builds the select of a player's stats over a moving window of games, one row per game.
+
+    The games are ordered by (date, id) and aggregated with SQL window functions, so only
+    one row per game of the player leaves the database. In rolling mode the window is the
+    game and the `window - 1` games before it, across seasons. In cumulative mode it is
+    every game of the season up to and including the game. Each row has the game's own
+    value of every field, and `<field>_sum` and `<field>_avg` (per game) over the window.
+    Ratios only have `<field>_avg`, computed from the window's sums like the /stats/*
+    endpoints do (e.g. the window's makes over its attempts). `games` is the number of
+    games in the window, less than `window` for the first games.
+
+    Args:
+        player_id (UUID): player whose stat lines are aggregated
+        fields (str): comma separated fields to aggregate, all STAT_FIELDS if None
+        window (int): number of games in the window, ignored in cumulative mode
+        mode (RollingMode): rolling or cumulative (season to date)
+        season (str): only return the games of this season. Rolling windows still
+            reach into the previous season.
+
+    Raises:
+        ValueError: if a field is not valid
+    """
+    fields = _split(fields) or STAT_FIELDS
+    unknown = [f for f in fields if f not in STAT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    order = (StatLine.date, StatLine.id)
+    if mode == RollingMode.cumulative:
+        over = {"partition_by": StatLine.season, "order_by": order, "rows": (None, 0)}
+    else:
+        over = {"order_by": order, "rows": (-(window - 1), 0)}
+    games = func.count().over(**over)
+    sums = SimpleNamespace(
+        **{f: func.sum(getattr(StatLine, f)).over(**over) for f in SUM_FIELDS}
+    )
+
+    columns = [StatLine.id, StatLine.date, StatLine.opponent, StatLine.season]
+    columns.append(games.label("games"))
+    for field in fields:
+        columns.append(getattr(StatLine, field))
+        if field in RATIOS:
+            columns.append(ratio_column(field, sums).element.label(f"{field}_avg"))
+        else:
+            columns.append(getattr(sums, field).label(f"{field}_sum"))
+            columns.append((getattr(sums, field) * 1.0 / games).label(f"{field}_avg"))
+
+    statement = select(*columns).where(StatLine.player_id == player_id)
+    if season is None:
+        return statement.order_by(*order)
+    # Filtered after the windows are computed, so the first games of the season still
+    # average over the end of the previous one
+    rows = statement.subquery()
+    return select(rows).where(rows.c.season == season).order_by(rows.c.date, rows.c.id)
@@ -0,0 +1,205 @@
+import hashlib
+import json
+from enum import Enum
+from typing import List
+from pydantic import ValidationError
+from pydantic.json import pydantic_encoder
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, SQLModel, select, tuple_
+from .models import *
+
+
+MAX_BULK_ROWS = 10000
+
+# Largest number of keys looked up in a single IN (...) query
+LOOKUP_CHUNK_SIZE = 400
+
+
+# Columns only used by the upserts, left out of every response
+INTERNAL_COLUMNS = {"content_hash"}
+
+
+def public_columns(table_model) -> list:
+    """Returns the columns of a table model that are part of its responses, in table order."""
+    return [
+        column
+        for column in table_model.__table__.columns
+        if column.name not in INTERNAL_COLUMNS
+    ]
+
+
+class OnConflict(str, Enum):
+    update = "update"
+
+
+def content_hash(item: SQLModel) -> str:
+    """Returns a hash of the content of a create model, used by upserts to skip unchanged rows."""
+    return hash_content(item.dict())
+
+
+def hash_content(fields: dict) -> str:
+    """Returns the content hash of the fields of a create model, as content_hash does.
+
+    The fields are serialized like the model's .json(sort_keys=True), so a dict with the
+    model's fields and types hashes the same as the model built from it.
+    """
+    encoded = json.dumps(fields, sort_keys=True, default=pydantic_encoder)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def validate_rows(rows: List[dict], create_model, table_model):
+    """Validates a batch of raw rows, returning the status of every row and the valid records.
+
+    Invalid rows are reported with their validation errors instead of failing the whole
+    batch, so the caller can fix and resend just those rows.
+
+    Args:
+        rows (List[dict]): rows sent by the client
+        create_model: model the rows are validated against (e.g. StatLineCreate)
+        table_model: table model the valid rows are turned into (e.g. StatLine)
+    """
+    statuses = []
+    records = []
+    for index, row in enumerate(rows):
+        try:
+            item = create_model.parse_obj(row)
+        except ValidationError as e:
+            statuses.append({"index": index, "status": "invalid", "errors": e.errors()})
+            continue
+        record = table_model.from_orm(item)
+        if "content_hash" in table_model.__fields__:
+            record.content_hash = content_hash(item)
+        statuses.append({"index": index, "status": "created", "id": record.id})
+        records.append((index, record))
+    return statuses, records
+
+
+def drop_duplicates(session: Session, statuses: list, records: list, key_columns: list):
+    """Marks and removes the records whose unique key already exists or repeats in the batch.
+
+    Existing keys are looked up with one IN (...) query per chunk of keys, rather than one
+    query per row.
+
+    Args:
+        session (Session): session of the request
+        statuses (list): statuses returned by validate_rows, updated in place
+        records (list): (index, record) pairs returned by validate_rows
+        key_columns (list): columns of the table's unique key
+    """
+    names = [column.key for column in key_columns]
+    keys = [tuple(getattr(record, name) for name in names) for _, record in records]
+
+    existing = set()
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start : start + LOOKUP_CHUNK_SIZE]
+        if len(key_columns) == 1:
+            condition = key_columns[0].in_([key[0] for key in chunk])
+        else:
+            condition = tuple_(*key_columns).in_(chunk)
+        existing.update(
+            tuple(row) for row in session.execute(select(*key_columns).where(condition))
+        )
+
+    unique = []
+    for key, (index, record) in zip(keys, records):
+        if key in existing:
+            statuses[index] = {"index": index, "status": "duplicate"}
+            continue
+        existing.add(key)
+        unique.append((index, record))
+    return unique
+
+
+def collapse_duplicates(statuses: list, records: list, key_columns: list):
+    """Keeps the last of the records that repeat a unique key in the batch, for upserts.
+
+    An upsert would apply every copy in turn and leave the last one, so the earlier copies
+    are marked as duplicates and removed before anything is counted or written.
+
+    Args:
+        statuses (list): statuses returned by validate_rows, updated in place
+        records (list): (index, record) pairs returned by validate_rows
+        key_columns (list): columns of the table's unique key
+    """
+    names = [column.key for column in key_columns]
+    last = {}
+    for index, record in records:
+        last[tuple(getattr(record, name) for name in names)] = index
+
+    unique = []
+    for index, record in records:
+        if last[tuple(getattr(record, name) for name in names)] != index:
+            statuses[index] = {"index": index, "status": "duplicate"}
+            continue
+        unique.append((index, record))
+    return unique
+
+
+def insert_records(session: Session, table_model, records: list):
+    """Inserts the records with a single executemany INSERT in the caller's transaction."""
+    if records:
+        session.execute(
+            table_model.__table__.insert(), [record.dict() for _, record in records]
+        )
+
+
+def upsert_records(session: Session, table_model, records: list, key_columns: list):
+    """Inserts the records, updating the existing rows that share their unique key.
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE statement, so no row is looked up
+    beforehand. Rows whose content hash did not change are left alone, which makes
+    re-sending an unchanged batch cost no writes. The id and created_on of existing rows
+    are kept and their last_modified is set to now.
+
+    Args:
+        session (Session): session of the request
+        table_model: table model with a content_hash column (e.g. Player, GameStat)
+        records (list): (index, record) pairs returned by validate_rows
+        key_columns (list): columns of the unique key the conflict is detected on
+    """
+    if not records:
+        return
+
+    table = table_model.__table__
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    keys = {column.key for column in key_columns}
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.key for column in key_columns],
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if column.name not in keys | {"id", "created_on"}
+        },
+        where=table.c.content_hash.is_distinct_from(statement.excluded.content_hash),
+    )
+    now = datetime.datetime.utcnow()
+    session.execute(
+        statement, [dict(record.dict(), last_modified=now) for _, record in records]
+    )
+
+
+def fetch_by_ids(session: Session, statement, table_model, ids: List[UUID]):
+    """Fetches the records with the given ids, returned in the order the ids were given.
+
+    The records are read with WHERE id IN (...), a single query unless there are more than
+    LOOKUP_CHUNK_SIZE distinct ids, instead of one query per id.
+
+    Args:
+        session (Session): session of the request
+        statement: select of the table model, e.g. with loader options
+        table_model: table model being read (e.g. Player, StatLine)
+        ids (List[UUID]): ids to fetch, repeated ids get the same record
+
+    Returns the records, with None in place of the ids that were not found, and the ids
+    that were not found.
+    """
+    unique = list(dict.fromkeys(ids))
+    found = {}
+    for start in range(0, len(unique), LOOKUP_CHUNK_SIZE):
+        chunk = unique[start : start + LOOKUP_CHUNK_SIZE]
+        for record in session.execute(
+            statement.where(table_model.id.in_(chunk))
+        ).scalars():
+            found[record.id] = record
+    return [found.get(id) for id in ids], [id for id in unique if id not in found]
@@ -0,0 +1,474 @@
+"""Generates a seeded, internally consistent synthetic dataset for development and load testing.
+
+Every game is a Christopher Newport University game against one of the other teams, on a
+date of its own. The CNU players' stat lines of each game are inserted, and the game gets
+a GameStat row built from them and the opponent's box score, which is only kept in
+memory. Run from the api directory against DATABASE_URL:
+
+    python -m db.generate --statlines 1000000 --seed 0 --reset
+"""
+import argparse
+import datetime
+import math
+import uuid
+from types import SimpleNamespace
+import numpy as np
+from sqlmodel import Session, delete, func, select, update
+from .models import *
+from .bulk import content_hash, hash_content
+from .metrics import DERIVED_FIELDS, RATIOS
+from .rollups import ROLLUP_MODELS, SUM_FIELDS, rebuild_rollups
+from .season_totals import rebuild_season_totals
+
+
+TEAM = "Christopher Newport University"
+OPPONENTS = [
+    "Mary Washington",
+    "Marymount University",
+    "Virginia Wesleyan University",
+    "University of Mount Union",
+    "Swathmore",
+    "Salisbury University",
+    "York College (PA)",
+    "Lynchburg University",
+]
+# fmt: off
+FIRST_NAMES = [
+    "Nathan", "Tyler", "Spencer", "Tim", "Ben", "Marcus", "Jalen", "Chris", "Drew",
+    "Evan", "Kyle", "Jordan", "Isaiah", "Caleb", "Owen", "Mason", "Trey", "Devin",
+    "Aaron", "Noah",
+]
+LAST_NAMES = [
+    "Roberts", "Femi", "Marin", "Daly", "Watkins", "Johnson", "Carter", "Brooks",
+    "Hayes", "Bennett", "Coleman", "Price", "Foster", "Graham", "Reed", "Sullivan",
+    "Ward", "Powell", "Jenkins", "Hughes",
+]
+# fmt: on
+HOMETOWNS = [
+    "Fairfax, VA | Fairfax HS",
+    "Chantilly, VA | Chantilly HS",
+    "Springfield, VA | West Springfield HS",
+    "Midlothian, VA | James River HS",
+    "Richmond, VA | Colonial Forge HS",
+    "Newport News, VA | Menchville HS",
+    "Virginia Beach, VA | Cox HS",
+    "Norfolk, VA | Maury HS",
+]
+
+FIRST_SEASON = 2012
+# Seasons start on November 1st and their games are spread over SEASON_DAYS days
+SEASON_DAYS = 150
+# Games in a season, seasons are added as the number of games grows
+GAMES_PER_SEASON = 30
+# Stat lines of each team in a game
+LINES_PER_TEAM = 10
+# Games generated and inserted at a time
+GENERATE_BATCH_GAMES = 2_000
+# Float fields of a game stat, some of them are computed as ints
+GAMESTAT_FLOAT_FIELDS = [
+    name for name, field in GameStatCreate.__fields__.items() if field.type_ is float
+]
+
+
+def _uuids(rng, count: int):
+    data = rng.bytes(16 * count)
+    return [
+        uuid.UUID(bytes=data[i : i + 16], version=4) for i in range(0, len(data), 16)
+    ]
+
+
+def _ratio(numerator, denominator, empty):
+    """Divides element-wise, `empty` where the denominator is 0."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return np.where(np.isnan(out), empty, out) if empty is not None else out
+
+
+def _season(index: int) -> str:
+    return f"{FIRST_SEASON + index}-{FIRST_SEASON + index + 1}"
+
+
+def generate_players(session: Session, rng, count: int):
+    """Inserts the Christopher Newport roster and returns the players' ids as an array."""
+    ids = _uuids(rng, count)
+    classes = rng.integers(0, len(ClassEnum), count)
+    positions = rng.integers(0, len(PositionEnum), count)
+    heights = rng.integers(70, 84, count)
+    weights = rng.integers(170, 260, count)
+    hometowns = rng.integers(0, len(HOMETOWNS), count)
+    jerseys = rng.integers(0, 56, count)
+
+    records = []
+    for i in range(count):
+        # Names are unique up to len(FIRST_NAMES) * len(LAST_NAMES) players, then numbered
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]
+        full_name = f"{first} {last}"
+        if i >= len(FIRST_NAMES) * len(LAST_NAMES):
+            full_name += f" {i}"
+        player = PlayerCreate(
+            full_name=full_name,
+            class_name=list(ClassEnum)[classes[i]],
+            position=list(PositionEnum)[positions[i]],
+            height=f"{heights[i] // 12}'{heights[i] % 12}",
+            weight=str(weights[i]),
+            hometown_hs=HOMETOWNS[hometowns[i]],
+            jersey_num=int(jerseys[i]),
+        )
+        now = datetime.datetime.utcnow()
+        records.append(
+            dict(
+                player.dict(),
+                id=ids[i],
+                created_on=now,
+                last_modified=now,
+                content_hash=content_hash(player),
+            )
+        )
+    session.execute(Player.__table__.insert(), records)
+    return np.array(ids, dtype=object)
+
+
+def schedule(rng, games: int, opponents: int, seasons: int):
+    """Returns the season, date and opponent (as an index) of every game, ordered by date.
+
+    Every game is on a different date, since a GameStat is unique to its date. A season is
+    added for every GAMES_PER_SEASON games, one per year, until the seasons would run past
+    the last year a date can have. Past that the seasons get more games instead, up to one
+    a day.
+
+    Args:
+        games (int): number of games
+        opponents (int): number of opponents
+        seasons (int): minimum number of seasons
+    """
+    last_season = datetime.MAXYEAR - FIRST_SEASON
+    seasons = min(max(seasons, math.ceil(games / GAMES_PER_SEASON)), last_season)
+    if math.ceil(games / seasons) > SEASON_DAYS:
+        raise ValueError(f"At most {last_season * SEASON_DAYS} games can be scheduled")
+
+    season, dates = [], []
+    for index, split in enumerate(np.array_split(np.arange(games), seasons)):
+        start = datetime.date(FIRST_SEASON + index, 11, 1)
+        season.append(np.full(len(split), index))
+        offsets = np.sort(rng.choice(SEASON_DAYS, len(split), replace=False))
+        dates.extend(start + datetime.timedelta(days=int(day)) for day in offsets)
+    return np.concatenate(season), dates, rng.integers(0, opponents, games)
+
+
+def box_scores(rng, games: int):
+    """Returns the counting stats of LINES_PER_TEAM players for both teams of each game.
+
+    Every array has the shape (games, 2, LINES_PER_TEAM), Christopher Newport first and
+    the opponent second. Made shots never exceed attempts,
+    threes are part of the field goals, points are 2 * twos + 3 * threes + free throws and
+    total rebounds are offensive + defensive rebounds. Ties are broken by one more made
+    free throw for a random side.
+    """
+    shape = (games, 2, LINES_PER_TEAM)
+    fga = rng.poisson(8, shape)
+    three_fga = rng.binomial(fga, 0.35)
+    three_fgm = rng.binomial(three_fga, 0.34)
+    two_fgm = rng.binomial(fga - three_fga, 0.5)
+    fta = rng.poisson(2.5, shape)
+    ftm = rng.binomial(fta, 0.72)
+    off_reb = rng.poisson(1.2, shape)
+    def_reb = rng.poisson(3.0, shape)
+    stats = SimpleNamespace(
+        fga=fga,
+        fgm=two_fgm + three_fgm,
+        three_fga=three_fga,
+        three_fgm=three_fgm,
+        fta=fta,
+        ftm=ftm,
+        off_reb=off_reb,
+        def_reb=def_reb,
+        tot_reb=off_reb + def_reb,
+        pf=rng.binomial(5, 0.4, shape),
+        ast=rng.poisson(2.0, shape),
+        to=rng.poisson(1.5, shape),
+        blk=rng.poisson(0.5, shape),
+        stl=rng.poisson(0.8, shape),
+        pts=2 * two_fgm + 3 * three_fgm + ftm,
+    )
+
+    totals = stats.pts.sum(axis=2)
+    ties = np.flatnonzero(totals[:, 0] == totals[:, 1])
+    winners = rng.integers(0, 2, len(ties))
+    for field in ("fta", "ftm", "pts"):
+        getattr(stats, field)[ties, winners, 0] += 1
+    return stats
+
+
+def statline_records(rng, stats, dates, seasons, opponents, roster):
+    """Returns the statLines rows of the Christopher Newport players of a batch of games.
+
+    Only the first side of the box scores is inserted, a stat line is always a CNU
+    player's line against the game's opponent. Their ratios are computed too.
+    """
+    games = len(dates)
+    # A random LINES_PER_TEAM players of the roster play each game
+    picks = np.argsort(rng.random((games, len(roster))), axis=1)
+    player_ids = roster[picks[:, :LINES_PER_TEAM]].ravel()
+
+    per_line = lambda values: np.repeat(values, LINES_PER_TEAM)
+    flat = SimpleNamespace(**{f: getattr(stats, f)[:, 0].ravel() for f in SUM_FIELDS})
+
+    columns = {f: getattr(flat, f).tolist() for f in SUM_FIELDS}
+    columns["fg_pct"] = _ratio(flat.fgm, flat.fga, 0.0).tolist()
+    columns["three_pt_pct"] = _ratio(flat.three_fgm, flat.three_fga, 0.0).tolist()
+    columns["ft_pct"] = _ratio(flat.ftm, flat.fta, 0.0).tolist()
+    for field in DERIVED_FIELDS:
+        numerator, denominator = RATIOS[field]
+        values = _ratio(numerator(flat), denominator(flat), None)
+        columns[field] = [None if np.isnan(v) else v for v in values.tolist()]
+
+    now = datetime.datetime.utcnow()
+    columns["id"] = _uuids(rng, len(player_ids))
+    columns["player_id"] = player_ids.tolist()
+    columns["date"] = [dates[i] for i in per_line(np.arange(games))]
+    columns["season"] = [seasons[i] for i in per_line(np.arange(games))]
+    columns["team"] = [TEAM] * len(player_ids)
+    columns["opponent"] = [opponents[i] for i in per_line(np.arange(games))]
+    columns["created_on"] = [now] * len(player_ids)
+    columns["last_modified"] = columns["created_on"]
+
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
+def gamestat_fields(rng, totals: dict, index: int) -> dict:
+    """Returns the box score fields of the GameStat of one game from its box scores.
+
+    Args:
+        totals (dict): team totals of every counting stat as nested lists of shape
+            (games, 2), summed over the players of the batch's box scores at once
+        index (int): index of the game in the batch
+    """
+    team = SimpleNamespace(**{f: totals[f][index][0] for f in SUM_FIELDS})
+    opp = SimpleNamespace(**{f: totals[f][index][1] for f in SUM_FIELDS})
+    ratio = lambda made, attempts: made / attempts if attempts else 0.0
+    fields = {
+        "three_fga": team.three_fga,
+        "three_fgm": team.three_fgm,
+        "three_pt_percent": ratio(team.three_fgm, team.three_fga),
+        "ast": team.ast,
+        "blk": team.blk,
+        "cnu_score": team.pts,
+        "def_reb": team.def_reb,
+        "fg_percent": ratio(team.fgm, team.fga),
+        "fga": team.fga,
+        "fgm": team.fgm,
+        "ft_percent": ratio(team.ftm, team.fta),
+        "fta": team.fta,
+        "ftm": team.ftm,
+        "off_reb": team.off_reb,
+        "pf": team.pf,
+        "pts": team.pts,
+        "stl": team.stl,
+        "turnover": team.to,
+        "tot_reb": team.tot_reb,
+        "opp_three_fga": opp.three_fga,
+        "opp_three_fgm": opp.three_fgm,
+        "opp_three_pt_percent": ratio(opp.three_fgm, opp.three_fga),
+        "opp_ast": opp.ast,
+        "opp_blk": opp.blk,
+        "opp_def": opp.def_reb,
+        "opp_fg_percent": ratio(opp.fgm, opp.fga),
+        "opp_fga": opp.fga,
+        "opp_fgm": opp.fgm,
+        "opp_ft_percent": ratio(opp.ftm, opp.fta),
+        "opp_fta": opp.fta,
+        "opp_ftm": opp.ftm,
+        "opp_off_reb": opp.off_reb,
+        "opp_pf": opp.pf,
+        "opp_pts": opp.pts,
+        "opp_score": opp.pts,
+        "opp_stl": opp.stl,
+        "opp_turnover": opp.to,
+        "opp_tot_reb": opp.tot_reb,
+        "win": int(team.pts > opp.pts),
+        "home": int(rng.integers(0, 2)),
+        "overtime": int(rng.random() < 0.05),
+        "ranked": int(rng.random() < 0.1),
+    }
+    differences = {
+        "three_fga_diff": ("three_fga", "opp_three_fga"),
+        "three_fgm_diff": ("three_fgm", "opp_three_fgm"),
+        "three_pt_percent_diff": ("three_pt_percent", "opp_three_pt_percent"),
+        "ast_diff": ("ast", "opp_ast"),
+        "blk_diff": ("blk", "opp_blk"),
+        "def_diff": ("def_reb", "opp_def"),
+        "fg_percent_diff": ("fg_percent", "opp_fg_percent"),
+        "fga_diff": ("fga", "opp_fga"),
+        "fgm_diff": ("fgm", "opp_fgm"),
+        "ft_percent_diff": ("ft_percent", "opp_ft_percent"),
+        "fta_diff": ("fta", "opp_fta"),
+        "ftm_diff": ("ftm", "opp_ftm"),
+        "off_diff": ("off_reb", "opp_off_reb"),
+        "pf_diff": ("pf", "opp_pf"),
+        "stl_diff": ("stl", "opp_stl"),
+        "turnover_diff": ("turnover", "opp_turnover"),
+        "tot_diff": ("tot_reb", "opp_tot_reb"),
+    }
+    for field, (own, other) in differences.items():
+        fields[field] = fields[own] - fields[other]
+    return fields
+
+
+def season_averages(gamestats: list, totals: dict):
+    """Sets the season to date averages of a batch of game stats, counting the game itself.
+
+    Args:
+        gamestats (list): game stats of the batch, in date order
+        totals (dict): running (games, pts, tot_reb, opp_pts, opp_tot_reb) of each season,
+            updated and carried over to the next batch
+    """
+    for gamestat in gamestats:
+        games, pts, reb, opp_pts, opp_reb = totals.get(gamestat["season"], (0,) * 5)
+        games += 1
+        pts += gamestat["pts"]
+        reb += gamestat["tot_reb"]
+        opp_pts += gamestat["opp_pts"]
+        opp_reb += gamestat["opp_tot_reb"]
+        totals[gamestat["season"]] = (games, pts, reb, opp_pts, opp_reb)
+        gamestat["ppg_avg"] = pts / games
+        gamestat["rb_avg"] = reb / games
+        gamestat["opp_ppg_avg"] = opp_pts / games
+        gamestat["opp_rb_avg"] = opp_reb / games
+
+
+def generate(
+    session: Session,
+    statlines: int = 10_000,
+    teams: int = 8,
+    seasons: int = 10,
+    players_per_team: int = 15,
+    seed: int = 0,
+):
+    """Fills an empty database with a synthetic dataset, the same one for the same arguments.
+
+    Rows are generated with NumPy a batch of games at a time and inserted with executemany,
+    so only one batch is held in memory. The rollups and season totals are rebuilt once at
+    the end, in the database.
+
+    Args:
+        session (Session): session the rows are inserted with
+        statlines (int): number of stat lines to generate, rounded up to whole games
+        teams (int): number of teams, Christopher Newport and teams - 1 opponents
+        seasons (int): minimum number of seasons, starting with FIRST_SEASON, more are
+            added to keep about GAMES_PER_SEASON games in each
+        players_per_team (int): size of the Christopher Newport roster, at least
+            LINES_PER_TEAM
+        seed (int): seed of the random generator
+    """
+    if teams < 2 or players_per_team < LINES_PER_TEAM:
+        raise ValueError(f"Need 2 teams and {LINES_PER_TEAM} players per team")
+    rng = np.random.default_rng(seed)
+    names = OPPONENTS[: teams - 1]
+    names += [f"Team {i}" for i in range(len(names) + 1, teams)]
+
+    roster = generate_players(session, rng, players_per_team)
+    games = max(math.ceil(statlines / LINES_PER_TEAM), 1)
+    season, dates, opponent = schedule(rng, games, len(names), seasons)
+
+    totals = {}
+    for start in range(0, games, GENERATE_BATCH_GAMES):
+        batch = slice(start, start + GENERATE_BATCH_GAMES)
+        batch_dates = dates[batch]
+        batch_seasons = [_season(s) for s in season[batch]]
+        batch_opponents = [names[o] for o in opponent[batch]]
+        stats = box_scores(rng, len(batch_dates))
+        session.execute(
+            StatLine.__table__.insert(),
+            statline_records(
+                rng, stats, batch_dates, batch_seasons, batch_opponents, roster
+            ),
+        )
+
+        team_totals = {f: getattr(stats, f).sum(axis=2).tolist() for f in SUM_FIELDS}
+        gamestats = []
+        for index, date in enumerate(batch_dates):
+            gamestat = gamestat_fields(rng, team_totals, index)
+            gamestat.update(
+                date=date,
+                day=date.day,
+                month=date.month,
+                year=date.year,
+                weekday=date.weekday(),
+                opponent=batch_opponents[index],
+                season=batch_seasons[index],
+            )
+            gamestats.append(gamestat)
+        # The schedule is in date order, so the totals of a batch carry over to the next
+        season_averages(gamestats, totals)
+
+        # The rows get the fields and types of GameStatCreate, so they are hashed like an
+        # upsert would hash them without validating each one
+        for gamestat in gamestats:
+            for field in GAMESTAT_FLOAT_FIELDS:
+                gamestat[field] = float(gamestat[field])
+        now = datetime.datetime.utcnow()
+        session.execute(
+            GameStat.__table__.insert(),
+            [
+                dict(
+                    gamestat,
+                    id=id,
+                    created_on=now,
+                    last_modified=now,
+                    content_hash=hash_content(gamestat),
+                )
+                for gamestat, id in zip(gamestats, _uuids(rng, len(gamestats)))
+            ],
+        )
+
+    bump_versions(session)
+    session.commit()
+    rebuild_rollups(session)
+    rebuild_season_totals(session)
+
+
+def bump_versions(session: Session):
+    # The data of every table changed, the ETags handed out by a running API no longer apply
+    session.execute(update(DataVersion).values(version=DataVersion.version + 1))
+
+
+def reset(session: Session):
+    """Deletes every player, stat line, game stat, rollup and season total."""
+    for model in [*ROLLUP_MODELS, GameSeasonTotals, StatLine, GameStat, Player]:
+        session.exec(delete(model))
+    bump_versions(session)
+    session.commit()
+
+
+if __name__ == "__main__":
+    from .database import create_db_and_tables, engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--statlines", type=int, default=10_000)
+    parser.add_argument("--teams", type=int, default=8)
+    parser.add_argument("--seasons", type=int, default=10)
+    parser.add_argument("--players-per-team", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--reset", action="store_true", help="delete the existing data first"
+    )
+    arguments = parser.parse_args()
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        if arguments.reset:
+            reset(session)
+        elif session.exec(select(func.count()).select_from(Player)).one():
+            parser.error("the database already has data, use --reset to replace it")
+        generate(
+            session,
+            statlines=arguments.statlines,
+            teams=arguments.teams,
+            seasons=arguments.seasons,
+            players_per_team=arguments.players_per_team,
+            seed=arguments.seed,
+        )
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from sqlmodel import Session, func, update
+from .models import *
+
+
+# Ratio stats as (numerator, denominator) of counting stats. The same definitions are
+# evaluated on a single stat line at write time and, in SQL, on the sums of a group so
+# that a group's percentage is its total makes over its total attempts.
+RATIOS = {
+    "ft_pct": (lambda s: s.ftm, lambda s: s.fta),
+    "fg_pct": (lambda s: s.fgm, lambda s: s.fga),
+    "three_pt_pct": (lambda s: s.three_fgm, lambda s: s.three_fga),
+    "efg_pct": (lambda s: s.fgm + 0.5 * s.three_fgm, lambda s: s.fga),
+    "ts_pct": (lambda s: s.pts, lambda s: 2 * (s.fga + 0.44 * s.fta)),
+    "pts_per_shot": (lambda s: s.pts, lambda s: s.fga),
+    "ast_to_ratio": (lambda s: s.ast, lambda s: s.to),
+}
+
+# Ratios stored on each stat line when it is written
+DERIVED_FIELDS = ["efg_pct", "ts_pct", "pts_per_shot", "ast_to_ratio"]
+
+
+def ratio_column(field: str, sums):
+    """Returns the SQL expression of a ratio stat computed from sums of counting stats.
+
+    Args:
+        field (str): one of RATIOS
+        sums: object with a column expression per counting stat, e.g. a rollup model or a
+            namespace of func.sum() columns
+    """
+    numerator, denominator = RATIOS[field]
+    # * 1.0 avoids integer division, NULLIF returns null instead of dividing by zero
+    return (numerator(sums) * 1.0 / func.nullif(denominator(sums), 0)).label(field)
+
+
+def statline_sums(fields):
+    """Returns a namespace of func.sum() over the StatLine columns, usable with ratio_column."""
+    return SimpleNamespace(**{f: func.sum(getattr(StatLine, f)) for f in fields})
+
+
+def compute_derived_metrics(statline: StatLine):
+    """Computes and sets the derived ratio stats of a stat line, None when there were no attempts."""
+    for field in DERIVED_FIELDS:
+        numerator, denominator = RATIOS[field]
+        attempts = denominator(statline)
+        setattr(statline, field, numerator(statline) / attempts if attempts else None)
+
+
+def backfill_derived_metrics(session: Session):
+    """Computes the derived ratio stats of the stat lines written before they existed."""
+    session.execute(
+        update(StatLine)
+        .where(*[getattr(StatLine, field) == None for field in DERIVED_FIELDS])
+        .values(
+            {field: ratio_column(field, StatLine).element for field in DERIVED_FIELDS}
+        )
+    )
+    session.commit()
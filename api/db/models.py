@@ -2,7 +2,7 @@ from typing import List, Set, Optional
 from uuid import UUID, uuid4
 import datetime
 from enum import Enum, IntEnum
-from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
+from sqlmodel import Field, Index, Relationship, SQLModel, UniqueConstraint
 
 
 # === Choices as Enums ===
@@ -22,6 +22,15 @@ class PositionEnum(str, Enum):
     center = "C"
 
 
+class PlayerInclude(str, Enum):
+    stats = "stats"
+
+
+class RollingMode(str, Enum):
+    rolling = "rolling"
+    cumulative = "cumulative"
+
+
 # === Models ===
 
 
@@ -53,11 +62,23 @@ class StatLineBase(SQLModel):
 
 class StatLine(StatLineBase, table=True):
     __tablename__ = "statLines"
+    __table_args__ = (
+        Index("ix_statLines_player_id_season", "player_id", "season"),
+        Index("ix_statLines_opponent_date", "opponent", "date"),
+        Index("ix_statLines_season_date", "season", "date"),
+        Index("ix_statLines_date_id", "date", "id"),
+    )
 
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     created_on: datetime.datetime = Field(default=datetime.datetime.utcnow())
     last_modified: datetime.datetime = Field(default=datetime.datetime.utcnow())
 
+    # Derived metrics, computed from the counting stats whenever the line is written
+    efg_pct: Optional[float] = Field(default=None)
+    ts_pct: Optional[float] = Field(default=None)
+    pts_per_shot: Optional[float] = Field(default=None)
+    ast_to_ratio: Optional[float] = Field(default=None)
+
     # Relationships
     player_id: Optional[UUID] = Field(default=None, foreign_key="players.id")
 
@@ -68,6 +89,10 @@ class StatLineCreate(StatLineBase):
 
 class StatLineRead(StatLineBase):
     id: UUID
+    efg_pct: Optional[float] = None
+    ts_pct: Optional[float] = None
+    pts_per_shot: Optional[float] = None
+    ast_to_ratio: Optional[float] = None
 
 
 class StatLineUpdate(SQLModel):
@@ -110,9 +135,12 @@ class Player(PlayerBase, table=True):
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     created_on: datetime.datetime = Field(default=datetime.datetime.utcnow())
     last_modified: datetime.datetime = Field(default=datetime.datetime.utcnow())
+    content_hash: Optional[str] = Field(default=None)
 
     # Relationships
-    stats: Optional[List["StatLine"]] = Relationship()
+    stats: Optional[List["StatLine"]] = Relationship(
+        sa_relationship_kwargs={"order_by": "(StatLine.date, StatLine.id)"}
+    )
 
 
 class PlayerCreate(PlayerBase):
@@ -135,6 +163,8 @@ class PlayerUpdate(SQLModel):
 
 # === Game Stats Model ===
 class GameStatBase(SQLModel):
+    # ppg_avg, rb_avg, opp_ppg_avg and opp_rb_avg are season to date averages maintained by
+    # the API, the values sent by clients are replaced and can be left out
     three_fga: int
     three_fga_diff: int
     three_fgm: int
@@ -180,9 +210,9 @@ class GameStatBase(SQLModel):
     opp_ftm: int
     opp_off_reb: int
     opp_pf: int
-    opp_ppg_avg: float
+    opp_ppg_avg: float = Field(default=0.0)
     opp_pts: int
-    opp_rb_avg: float
+    opp_rb_avg: float = Field(default=0.0)
     opp_score: int
     opp_stl: int
     opp_turnover: int
@@ -191,10 +221,10 @@ class GameStatBase(SQLModel):
     overtime: int
     pf: int
     pf_diff: int
-    ppg_avg: float
+    ppg_avg: float = Field(default=0.0)
     pts: int
     ranked: int
-    rb_avg: float
+    rb_avg: float = Field(default=0.0)
     season: str
     stl: int
     stl_diff: int
@@ -209,10 +239,15 @@ class GameStatBase(SQLModel):
 
 class GameStat(GameStatBase, table=True):
     __tablename__ = "gamestats"
+    __table_args__ = (
+        Index("ix_gamestats_season_date", "season", "date"),
+        Index("ix_gamestats_opponent_date", "opponent", "date"),
+    )
 
     id: Optional[UUID] = Field(default_factory=uuid4, primary_key=True)
     created_on: datetime.datetime = Field(default=datetime.datetime.utcnow())
     last_modified: datetime.datetime = Field(default=datetime.datetime.utcnow())
+    content_hash: Optional[str] = Field(default=None)
 
 
 class GameStatCreate(GameStatBase):
@@ -223,6 +258,87 @@ class GameStatRead(GameStatBase):
     id: UUID
 
 
+# === Game Season Totals Model ===
+# Running totals of each season's game stats, the season to date averages of a new game are
+# computed from them without reading the season. Derived from gamestats.
+class GameSeasonTotals(SQLModel, table=True):
+    __tablename__ = "gameSeasonTotals"
+    __table_args__ = {"info": {"derived": True}}
+
+    season: str = Field(primary_key=True)
+    games: int = Field(default=0)
+    pts: int = Field(default=0)
+    tot_reb: int = Field(default=0)
+    opp_pts: int = Field(default=0)
+    opp_tot_reb: int = Field(default=0)
+    last_date: Optional[datetime.date] = None
+
+
+# === Data Version Model ===
+# Version of the data of each table, bumped in the transaction of every write to it. The
+# ETags are built from it, so every worker hands out the same ETag for the same data.
+class DataVersion(SQLModel, table=True):
+    __tablename__ = "dataVersions"
+
+    table_name: str = Field(primary_key=True)
+    # Drawn when the row is created, so the ETags handed out by a database that was since
+    # recreated can never match
+    epoch: str
+    version: int = Field(default=0)
+
+
+# === Stat Rollup Models ===
+# Rollups only hold sums of the counting stats, percentages are computed from the sums when
+# they are read. The tables are derived from statLines and rebuilt if their schema changes.
+class StatRollupBase(SQLModel):
+    lines: int = Field(default=0)
+    ftm: int = Field(default=0)
+    fta: int = Field(default=0)
+    fga: int = Field(default=0)
+    fgm: int = Field(default=0)
+    three_fga: int = Field(default=0)
+    three_fgm: int = Field(default=0)
+    off_reb: int = Field(default=0)
+    def_reb: int = Field(default=0)
+    tot_reb: int = Field(default=0)
+    pf: int = Field(default=0)
+    ast: int = Field(default=0)
+    to: int = Field(default=0)
+    blk: int = Field(default=0)
+    stl: int = Field(default=0)
+    pts: int = Field(default=0)
+
+
+class PlayerRollup(StatRollupBase, table=True):
+    __tablename__ = "playerRollups"
+    __table_args__ = {"info": {"derived": True}}
+
+    player_id: UUID = Field(foreign_key="players.id", primary_key=True)
+
+
+class TeamRollup(StatRollupBase, table=True):
+    __tablename__ = "teamRollups"
+    __table_args__ = {"info": {"derived": True}}
+
+    opponent: str = Field(primary_key=True)
+
+
+class SeasonRollup(StatRollupBase, table=True):
+    __tablename__ = "seasonRollups"
+    __table_args__ = {"info": {"derived": True}}
+
+    season: str = Field(primary_key=True)
+
+
+class GameRollup(StatRollupBase, table=True):
+    __tablename__ = "gameRollups"
+    __table_args__ = {"info": {"derived": True}}
+
+    date: datetime.date = Field(primary_key=True)
+    team: str
+    opponent: str
+
+
 # === Relational Model Views ===
 class StatLineReadWithPlayer(StatLineRead):
     player_id: Optional[PlayerRead] = None
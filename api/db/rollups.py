@@ -0,0 +1,170 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, delete, func, select
+from .models import *
+from .bulk import LOOKUP_CHUNK_SIZE
+from .metrics import DERIVED_FIELDS, RATIOS, ratio_column
+
+
+# Columns of StatLine that are summed into the rollups
+SUM_FIELDS = [
+    "ftm",
+    "fta",
+    "fga",
+    "fgm",
+    "three_fga",
+    "three_fgm",
+    "off_reb",
+    "def_reb",
+    "tot_reb",
+    "pf",
+    "ast",
+    "to",
+    "blk",
+    "stl",
+    "pts",
+]
+
+# Fields of the aggregate endpoints' responses, in the order they are returned
+STAT_FIELDS = [
+    "ftm",
+    "fta",
+    "ft_pct",
+    "fga",
+    "fgm",
+    "fg_pct",
+    "three_fga",
+    "three_fgm",
+    "three_pt_pct",
+    "off_reb",
+    "def_reb",
+    "tot_reb",
+    "pf",
+    "ast",
+    "to",
+    "blk",
+    "stl",
+    "pts",
+] + DERIVED_FIELDS
+
+ROLLUP_MODELS = [PlayerRollup, TeamRollup, SeasonRollup, GameRollup]
+
+
+def rollup_columns(model):
+    """Returns the columns of a rollup labelled and ordered like the aggregate endpoints' fields.
+
+    Args:
+        model: rollup model being read (e.g. PlayerRollup, SeasonRollup)
+    """
+    columns = []
+    for field in STAT_FIELDS:
+        if field in RATIOS:
+            columns.append(ratio_column(field, model))
+        else:
+            columns.append(getattr(model, field).label(field))
+    return columns
+
+
+def _rollup_keys(statline: StatLine):
+    """Yields the (rollup model, primary key, key columns) of every rollup a stat line counts towards."""
+    if statline.player_id is not None:
+        yield PlayerRollup, statline.player_id, {"player_id": statline.player_id}
+    yield TeamRollup, statline.opponent, {"opponent": statline.opponent}
+    yield SeasonRollup, statline.season, {"season": statline.season}
+    yield GameRollup, statline.date, {
+        "date": statline.date,
+        "team": statline.team,
+        "opponent": statline.opponent,
+    }
+
+
+def apply_statlines(session: Session, added=(), removed=()):
+    """Applies the change in a set of stat lines to the rollups, in the caller's transaction.
+
+    The deltas of all stat lines are summed per rollup first, then added to the rollups by
+    one INSERT ... ON CONFLICT DO UPDATE SET col = col + delta per rollup table. The
+    increment happens in the database, so concurrent writes to the same rollup can't
+    overwrite each other's deltas. Rollups left without any stat lines are deleted so that
+    lookups on them 404 like the raw aggregates did.
+
+    Args:
+        session (Session): session of the request that is writing the stat lines
+        added: stat lines (new values) to count into the rollups
+        removed: stat lines (old values) to take out of the rollups
+    """
+    deltas = {}
+    for sign, statlines in ((1, added), (-1, removed)):
+        for statline in statlines:
+            for model, key, key_columns in _rollup_keys(statline):
+                delta = deltas.setdefault(model, {}).setdefault(
+                    key, {**key_columns, "lines": 0, **dict.fromkeys(SUM_FIELDS, 0)}
+                )
+                delta["lines"] += sign
+                for field in SUM_FIELDS:
+                    delta[field] += sign * getattr(statline, field)
+
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    for model, rows in deltas.items():
+        table = model.__table__
+        key_column = table.primary_key.columns[0]
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[key_column.name],
+            set_={
+                field: table.c[field] + statement.excluded[field]
+                for field in ["lines", *SUM_FIELDS]
+            },
+        )
+        session.execute(statement, list(rows.values()))
+
+        keys = list(rows)
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            session.execute(
+                delete(table).where(
+                    table.c.lines <= 0,
+                    key_column.in_(keys[start : start + LOOKUP_CHUNK_SIZE]),
+                )
+            )
+
+
+def rebuild_rollups(session: Session):
+    """Recomputes every rollup from scratch out of the statLines table."""
+    for model in ROLLUP_MODELS:
+        session.exec(delete(model))
+
+    totals = [func.count().label("lines")]
+    totals += [func.sum(getattr(StatLine, field)).label(field) for field in SUM_FIELDS]
+    groupings = [
+        (PlayerRollup, [StatLine.player_id], [StatLine.player_id]),
+        (TeamRollup, [StatLine.opponent], [StatLine.opponent]),
+        (SeasonRollup, [StatLine.season], [StatLine.season]),
+        (
+            GameRollup,
+            [
+                StatLine.date,
+                func.min(StatLine.team).label("team"),
+                func.min(StatLine.opponent).label("opponent"),
+            ],
+            [StatLine.date],
+        ),
+    ]
+    # Each rollup is filled by one INSERT ... SELECT, the groups never leave the database
+    for model, keys, group_by in groupings:
+        statement = select(*keys, *totals).group_by(*group_by)
+        if model is PlayerRollup:
+            statement = statement.where(StatLine.player_id != None)
+        names = [column.key for column in statement.selected_columns]
+        session.execute(model.__table__.insert().from_select(names, statement))
+
+    session.commit()
+
+
+def sync_rollups(session: Session):
+    """Rebuilds the rollups if they do not account for every stat line in the database.
+
+    Every stat line is counted in exactly one season rollup, so comparing the totals is enough
+    to catch a database that was loaded (or created) without going through the API.
+    """
+    statlines = session.exec(select(func.count()).select_from(StatLine)).one()
+    counted = session.exec(select(func.sum(SeasonRollup.lines))).one() or 0
+    if statlines != counted:
+        rebuild_rollups(session)
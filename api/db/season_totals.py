@@ -0,0 +1,205 @@
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, delete, func, select, update
+from .models import *
+from .bulk import LOOKUP_CHUNK_SIZE
+
+
+# Season to date averages of a game stat, with the game stat they average
+AVERAGE_FIELDS = {
+    "ppg_avg": "pts",
+    "rb_avg": "tot_reb",
+    "opp_ppg_avg": "opp_pts",
+    "opp_rb_avg": "opp_tot_reb",
+}
+
+
+def _count(totals, gamestat):
+    totals.games += 1
+    for field in AVERAGE_FIELDS.values():
+        setattr(totals, field, getattr(totals, field) + getattr(gamestat, field))
+    return {
+        average: getattr(totals, field) / totals.games
+        for average, field in AVERAGE_FIELDS.items()
+    }
+
+
+def _existing_games(session: Session, dates: list) -> dict:
+    columns = [
+        getattr(GameStat, f) for f in [*AVERAGE_FIELDS.values(), *AVERAGE_FIELDS]
+    ]
+    games = {}
+    for start in range(0, len(dates), LOOKUP_CHUNK_SIZE):
+        chunk = dates[start : start + LOOKUP_CHUNK_SIZE]
+        statement = select(GameStat.date, GameStat.season, *columns).where(
+            GameStat.date.in_(chunk)
+        )
+        games.update((game.date, game) for game in session.execute(statement))
+    return games
+
+
+def _lock_totals(session: Session, seasons) -> dict:
+    """Returns the totals of the seasons, created if missing, locked until the transaction ends.
+
+    Every write to the games of a season goes through its totals row first, so concurrent
+    writes to a season are serialized by SELECT ... FOR UPDATE instead of overwriting each
+    other's totals. SQLite has a single writer at a time and ignores FOR UPDATE.
+    """
+    seasons = sorted(set(seasons))
+    if not seasons:
+        return {}
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    empty = {"games": 0, **dict.fromkeys(AVERAGE_FIELDS.values(), 0)}
+    session.execute(
+        dialect.insert(GameSeasonTotals.__table__).on_conflict_do_nothing(
+            index_elements=["season"]
+        ),
+        [{"season": season, **empty} for season in seasons],
+    )
+    statement = (
+        select(GameSeasonTotals)
+        .where(GameSeasonTotals.season.in_(seasons))
+        .order_by(GameSeasonTotals.season)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return {totals.season: totals for totals in session.execute(statement).scalars()}
+
+
+def assign_season_averages(session: Session, gamestats: list, replacing: bool = False):
+    """Sets the season to date averages of game stats that are about to be written.
+
+    The averages count the game itself. A game played after every game of its season is
+    added to the season's totals and its averages are read off them, so its cost does not
+    depend on the length of the season. Games inserted before the last game of their season,
+    and games replacing an existing one with a different season or different counted stats,
+    change the averages of the games after them: their seasons are returned to be
+    recomputed by recompute_season_averages once written. A game replacing an existing one
+    with the same counted stats keeps the averages already stored, and costs nothing more.
+
+    Args:
+        session (Session): session of the request, the totals are updated in its transaction
+        gamestats (list): GameStat records to be inserted (or upserted)
+        replacing (bool): whether the records can replace existing games with the same date
+
+    Returns a dict of season to the date its averages have to be recomputed from.
+    """
+    recompute = {}
+
+    def mark(season: str, date: datetime.date):
+        recompute[season] = min(recompute.get(season, date), date)
+
+    new_games = gamestats
+    existing = {}
+    if replacing:
+        existing = _existing_games(session, [gamestat.date for gamestat in gamestats])
+        new_games = []
+        for gamestat in gamestats:
+            stored = existing.get(gamestat.date)
+            if stored is None:
+                new_games.append(gamestat)
+            elif stored.season == gamestat.season and all(
+                getattr(stored, f) == getattr(gamestat, f)
+                for f in AVERAGE_FIELDS.values()
+            ):
+                for average in AVERAGE_FIELDS:
+                    setattr(gamestat, average, getattr(stored, average))
+            else:
+                # The replaced game is counted in its (maybe different) old season
+                mark(stored.season, gamestat.date)
+                mark(gamestat.season, gamestat.date)
+
+    totals_of = _lock_totals(
+        session,
+        [gamestat.season for gamestat in new_games] + list(recompute),
+    )
+
+    seasons = {}
+    for gamestat in sorted(new_games, key=lambda gamestat: gamestat.date):
+        seasons.setdefault(gamestat.season, []).append(gamestat)
+
+    for season, games in seasons.items():
+        totals = totals_of[season]
+        if season in recompute or (
+            totals.last_date is not None and games[0].date < totals.last_date
+        ):
+            mark(season, games[0].date)
+            continue
+
+        for gamestat in games:
+            for average, value in _count(totals, gamestat).items():
+                setattr(gamestat, average, value)
+        totals.last_date = games[-1].date
+
+    return recompute
+
+
+def recompute_season_averages(session: Session, recompute: dict):
+    """Recomputes the averages of the games of each season from a date on, and its totals.
+
+    Args:
+        session (Session): session of the request, after the game stats were written
+        recompute (dict): season to date, as returned by assign_season_averages
+    """
+    table = GameStat.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("gamestat_id"))
+        .values({average: bindparam(f"new_{average}") for average in AVERAGE_FIELDS})
+    )
+    columns = [getattr(GameStat, field) for field in AVERAGE_FIELDS.values()]
+
+    for season, start in recompute.items():
+        games = session.execute(
+            select(GameStat.id, GameStat.date, *columns)
+            .where(GameStat.season == season)
+            .order_by(GameStat.date)
+        ).all()
+
+        # Locked by assign_season_averages
+        totals = session.get(GameSeasonTotals, season)
+        if not games:
+            session.delete(totals)
+            continue
+        totals.games = 0
+        for field in AVERAGE_FIELDS.values():
+            setattr(totals, field, 0)
+
+        parameters = []
+        for game in games:
+            averages = _count(totals, game)
+            if game.date >= start:
+                parameters.append(
+                    {
+                        "gamestat_id": game.id,
+                        **{f"new_{name}": value for name, value in averages.items()},
+                    }
+                )
+        if parameters:
+            session.execute(statement, parameters)
+        totals.last_date = games[-1].date
+
+
+def rebuild_season_totals(session: Session):
+    """Recomputes the totals of every season from the gamestats table.
+
+    The averages stored on the game stats are left as they are.
+    """
+    session.exec(delete(GameSeasonTotals))
+    statement = select(
+        GameStat.season,
+        func.count().label("games"),
+        *[func.sum(getattr(GameStat, f)).label(f) for f in AVERAGE_FIELDS.values()],
+        func.max(GameStat.date).label("last_date"),
+    ).group_by(GameStat.season)
+    names = [column.key for column in statement.selected_columns]
+    session.execute(GameSeasonTotals.__table__.insert().from_select(names, statement))
+    session.commit()
+
+
+def sync_season_totals(session: Session):
+    """Rebuilds the season totals if they do not account for every game stat in the database."""
+    gamestats = session.exec(select(func.count()).select_from(GameStat)).one()
+    counted = session.exec(select(func.sum(GameSeasonTotals.games))).one() or 0
+    if gamestats != counted:
+        rebuild_season_totals(session)
@@ -0,0 +1,155 @@
+import datetime
+import logging
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+
+# Statements that take longer than this are logged with their plan
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+# Number of slow statements kept, the oldest ones are dropped first
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 100))
+# PostgreSQL only: capture EXPLAIN ANALYZE instead of EXPLAIN for slow SELECTs. ANALYZE
+# runs the statement a second time, so it is off unless asked for.
+SLOW_QUERY_EXPLAIN_ANALYZE = (
+    os.environ.get("SLOW_QUERY_EXPLAIN_ANALYZE", "false").lower() == "true"
+)
+
+# Statements that have a plan, anything else (PRAGMA, BEGIN, DDL, ...) is logged without one
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+logger = logging.getLogger(__name__)
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    return str(value)
+
+
+def _explain_statement(dialect: str, statement: str) -> Optional[str]:
+    """Returns the statement that explains a statement on a backend, None if it has no plan."""
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if keyword not in EXPLAINABLE:
+        return None
+    if dialect == "sqlite":
+        return f"EXPLAIN QUERY PLAN {statement}"
+    if dialect == "postgresql" and SLOW_QUERY_EXPLAIN_ANALYZE and keyword == "SELECT":
+        # Only reads are analyzed, analyzing a write would apply it a second time
+        return f"EXPLAIN (ANALYZE, BUFFERS) {statement}"
+    return f"EXPLAIN {statement}"
+
+
+def explain(conn, statement: str, parameters) -> Optional[list]:
+    """Returns the plan of a statement as a list of lines, run on the statement's connection.
+
+    The plan is read with a new cursor of the DBAPI connection, so it runs in the same
+    transaction (and sees the same data) without going through the engine's events again.
+    On PostgreSQL it is wrapped in a savepoint, a failed EXPLAIN would otherwise abort the
+    request's transaction.
+
+    Args:
+        conn: SQLAlchemy connection the statement was run on
+        statement (str): statement as sent to the driver
+        parameters: parameters the statement was run with
+    """
+    dialect = conn.dialect.name
+    explain_statement = _explain_statement(dialect, statement)
+    if explain_statement is None:
+        return None
+
+    savepoint = dialect == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(explain_statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as error:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return [f"EXPLAIN failed: {error}"]
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+
+    if dialect == "sqlite":
+        # (id, parent, notused, detail) rows, the detail is the readable part
+        return [row[-1] for row in rows]
+    return [" ".join(str(column) for column in row) for row in rows]
+
+
+class SlowQueryLog:
+    """Bounded in-memory log of the statements that took longer than the threshold.
+
+    Entries hold the statement, its parameters, the request that ran it and its plan,
+    newest last. The log lives in the worker process, so each worker keeps its own.
+    """
+
+    def __init__(self, threshold_ms: float, size: int):
+        self.threshold_ms = threshold_ms
+        self.recorded = 0
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        conn,
+        statement: str,
+        parameters,
+        executemany: bool,
+        seconds: float,
+        route: Optional[str],
+    ):
+        """Logs a statement if it was slow, with the plan of its first set of parameters."""
+        duration_ms = seconds * 1000
+        if duration_ms < self.threshold_ms or conn.info.get("explaining"):
+            return
+
+        first = parameters[0] if executemany and parameters else parameters
+        # The plan is captured by running another statement on the connection, which must
+        # not be logged itself however long it takes
+        conn.info["explaining"] = True
+        try:
+            plan = explain(conn, statement, first)
+        finally:
+            conn.info["explaining"] = False
+
+        entry = {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "route": route,
+            "statement": statement,
+            "parameters": _jsonable(first),
+            "executemany": len(parameters) if executemany else None,
+            "plan": plan,
+        }
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s", duration_ms, route or "-", statement
+        )
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold_ms,
+                "max_entries": self._entries.maxlen,
+                "recorded": self.recorded,
+                "entries": list(reversed(self._entries)),
+            }
+
+
+slow_queries = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE)
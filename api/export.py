@@ -0,0 +1,159 @@
+import csv
+import datetime
+import io
+import json
+from enum import Enum
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.sqltypes import GUID
+from db.bulk import public_columns
+from db.database import async_replica_engine
+
+
+EXPORT_BATCH_SIZE = 1000
+# Rows per Arrow record batch, which is also the size of the Parquet row groups
+ARROW_BATCH_SIZE = 50_000
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    arrow = "arrow"
+    parquet = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+# Arrow type of the columns of each SQL type, columns of any other type are strings
+ARROW_TYPES = [
+    (Boolean, pa.bool_()),
+    (Integer, pa.int64()),
+    (Float, pa.float64()),
+    (DateTime, pa.timestamp("us")),
+    (Date, pa.date32()),
+]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+async def stream_rows(model, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yields the rows of a table in batches, read straight off a server-side cursor.
+
+    AsyncSession.stream always executes with stream_results. Rows come back as plain
+    mappings rather than ORM objects, and only one batch is held in memory at a time. The
+    generator opens its own session because it keeps running after the endpoint has
+    returned its StreamingResponse.
+
+    Args:
+        model: table model to export (e.g. StatLine, GameStat)
+        batch_size (int): number of rows in each batch
+    """
+    table = model.__table__
+    statement = select(*public_columns(model)).order_by(table.c.date, table.c.id)
+    async with AsyncSession(async_replica_engine) as session:
+        result = await session.stream(statement)
+        async for rows in result.mappings().partitions(batch_size):
+            yield rows
+
+
+async def ndjson_lines(model):
+    """Yields the rows of a table as newline delimited JSON, one chunk per batch."""
+    async for rows in stream_rows(model):
+        yield "".join(
+            json.dumps(dict(row), default=_json_default) + "\n" for row in rows
+        )
+
+
+async def csv_lines(model):
+    """Yields the rows of a table as CSV with a header line, one chunk per batch."""
+    columns = [column.name for column in public_columns(model)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    async for rows in stream_rows(model):
+        writer.writerows([row[column] for column in columns] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only export of an empty table
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def arrow_schema(model) -> pa.Schema:
+    """Returns the Arrow schema of a table, with a typed column per column of the table."""
+    fields = []
+    for column in public_columns(model):
+        arrow_type = next(
+            (t for sql_type, t in ARROW_TYPES if isinstance(column.type, sql_type)),
+            pa.string(),
+        )
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+async def record_batches(model, schema: pa.Schema):
+    """Yields the rows of a table as Arrow record batches, built column by column."""
+    uuids = [
+        column.name for column in public_columns(model) if isinstance(column.type, GUID)
+    ]
+    async for rows in stream_rows(model, ARROW_BATCH_SIZE):
+        columns = {name: [row[name] for row in rows] for name in schema.names}
+        # Arrow has no UUID type, ids are exported as their canonical string
+        for name in uuids:
+            columns[name] = [None if id is None else str(id) for id in columns[name]]
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(columns[field.name], type=field.type) for field in schema],
+            schema=schema,
+        )
+
+
+async def arrow_chunks(model):
+    """Yields the rows of a table in the Arrow IPC streaming format, one chunk per batch."""
+    schema = arrow_schema(model)
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        async for batch in record_batches(model, schema):
+            writer.write_batch(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    # Schema only export of an empty table, and the end of stream marker
+    yield buffer.getvalue()
+
+
+async def parquet_chunks(model):
+    """Yields the rows of a table as a Parquet file, with a row group per batch."""
+    schema = arrow_schema(model)
+    buffer = io.BytesIO()
+    with pq.ParquetWriter(buffer, schema) as writer:
+        async for batch in record_batches(model, schema):
+            writer.write_batch(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    # The footer with the file's metadata is written when the writer is closed
+    yield buffer.getvalue()
+
+
+def export_lines(model, format: ExportFormat):
+    if format == ExportFormat.arrow:
+        return arrow_chunks(model)
+    if format == ExportFormat.parquet:
+        return parquet_chunks(model)
+    if format == ExportFormat.csv:
+        return csv_lines(model)
+    return ndjson_lines(model)
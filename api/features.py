@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import List
+import numpy as np
+from sqlmodel import Session, select
+from db.models import *
+from versioning import versions
+
+
+# Directory the feature matrices are cached in, shared by the workers of a host
+FEATURES_CACHE_DIR = os.environ.get("FEATURES_CACHE_DIR", "features_cache")
+FEATURES_BATCH_SIZE = 10_000
+
+# Column of the game stats used as the label, 1 for a win and 0 for a loss
+LABEL_FIELD = "win"
+
+# Columns of the feature matrix, in order: every numeric field of a game stat but the label.
+# They are the post-game box score, whose scoring columns (cnu_score, pts, the made shots
+# and their *_diff) determine the label, so the matrix describes games that were played
+# rather than the information available before one.
+FEATURE_FIELDS = [
+    name
+    for name, field in GameStatBase.__fields__.items()
+    if field.type_ in (int, float) and name != LABEL_FIELD
+]
+
+# What the manifest tells its readers the columns are
+FEATURES_KIND = "post-game box score, the label follows from the scoring columns"
+
+# Files built by this process, by seasons key, with the gamestats version they were built at
+_built = {}
+
+
+def _seasons_key(seasons: List[str]) -> str:
+    if not seasons:
+        return "all"
+    return hashlib.sha256(",".join(sorted(set(seasons))).encode()).hexdigest()[:16]
+
+
+def feature_paths(key: str, digest: str) -> dict:
+    """Returns the paths of the cached features, labels and manifest of a set of seasons.
+
+    The paths hold a digest of the files' content rather than the data version of the table,
+    so they stay valid across restarts and are shared by the workers reading the same data.
+
+    Args:
+        key (str): key of the seasons the game stats are filtered on, see _seasons_key
+        digest (str): digest of the feature matrix, labels, dates and columns
+    """
+    base = os.path.join(FEATURES_CACHE_DIR, f"gamestats-{key}-{digest}")
+    return {
+        "features": f"{base}.npy",
+        "labels": f"{base}.labels.npy",
+        "manifest": f"{base}.json",
+    }
+
+
+def _write(path: str, write):
+    # Written to a temporary file first and renamed so no reader ever sees a partial file
+    fd, temporary = tempfile.mkstemp(dir=FEATURES_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        write(file)
+    os.replace(temporary, path)
+
+
+def _prune(key: str, paths: dict):
+    # Files of the same seasons with another content are never served again, whichever
+    # process wrote them. A worker that still points at one rebuilds it from the database.
+    current = os.path.basename(paths["manifest"]).rsplit(".", 1)[0]
+    prefix = f"gamestats-{key}-"
+    for name in os.listdir(FEATURES_CACHE_DIR):
+        if name.startswith(prefix) and not name.startswith(current + "."):
+            try:
+                os.remove(os.path.join(FEATURES_CACHE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def build_features(session: Session, seasons: List[str]) -> dict:
+    """Materializes the game stats as a float32 feature matrix and label vector, if not cached.
+
+    The matrix is saved as a .npy file that can be opened with np.load(path, mmap_mode="r")
+    without reading it into memory. Its rows are the games ordered by date and its columns
+    are FEATURE_FIELDS. The manifest holds the column order, the date of every row and the
+    shape, and is written last, so its presence means the files are complete.
+
+    The game stats are read once per version of the table in each process. The files are
+    named after a digest of their content, so they are only written when that content is
+    not on disk yet, e.g. not again after a restart.
+
+    Args:
+        session (Session): session the game stats are read with
+        seasons (List[str]): only include the games of these seasons, all of them if empty
+
+    Returns the paths of the files, see feature_paths.
+    """
+    key = _seasons_key(seasons)
+    version = versions.get(session, ["gamestats"])
+    built = _built.get(key)
+    if (
+        built is not None
+        and built[0] == version
+        and os.path.exists(built[1]["manifest"])
+    ):
+        return built[1]
+    os.makedirs(FEATURES_CACHE_DIR, exist_ok=True)
+
+    columns = [getattr(GameStat, name) for name in [LABEL_FIELD, *FEATURE_FIELDS]]
+    statement = select(GameStat.date, *columns).order_by(GameStat.date)
+    if seasons:
+        statement = statement.where(GameStat.season.in_(seasons))
+
+    dates = []
+    blocks = [np.empty((0, len(columns)), dtype=np.float32)]
+    result = session.execute(statement, execution_options={"stream_results": True})
+    for rows in result.partitions(FEATURES_BATCH_SIZE):
+        dates.extend(row[0].isoformat() for row in rows)
+        blocks.append(np.array([row[1:] for row in rows], dtype=np.float32))
+    matrix = np.concatenate(blocks)
+
+    content = hashlib.sha256(matrix.tobytes())
+    content.update(json.dumps([FEATURE_FIELDS, dates]).encode())
+    digest = content.hexdigest()[:16]
+    paths = feature_paths(key, digest)
+
+    if not os.path.exists(paths["manifest"]):
+        manifest = {
+            "columns": FEATURE_FIELDS,
+            "label": LABEL_FIELD,
+            "kind": FEATURES_KIND,
+            "dtype": "float32",
+            "shape": list(matrix[:, 1:].shape),
+            "seasons": sorted(set(seasons)),
+            "dates": dates,
+            "version": digest,
+        }
+        _write(paths["features"], lambda file: np.save(file, matrix[:, 1:]))
+        _write(paths["labels"], lambda file: np.save(file, matrix[:, 0]))
+        _write(
+            paths["manifest"], lambda file: file.write(json.dumps(manifest).encode())
+        )
+    _built[key] = (version, paths)
+    _prune(key, paths)
+    return paths
+
+
+def load_features(session: Session, seasons: List[str] = ()):
+    """Returns the memory-mapped feature matrix, label vector and manifest of a set of seasons.
+
+    Args:
+        session (Session): session the game stats are read with if they are not cached
+        seasons (List[str]): only include the games of these seasons, all of them if empty
+    """
+    paths = build_features(session, list(seasons))
+    with open(paths["manifest"]) as file:
+        manifest = json.load(file)
+    features = np.load(paths["features"], mmap_mode="r")
+    labels = np.load(paths["labels"], mmap_mode="r")
+    return features, labels, manifest
@@ -0,0 +1,135 @@
+import threading
+from typing import Sequence, Tuple
+from db.database import QueryStats
+
+
+# Upper bounds of the histogram buckets, +Inf is added to each of them
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return ",".join(pairs)
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series of buckets per set of label values."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels: Tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, count, total) in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{_number(bound)}"}} {bucket}'
+                )
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_number(total)}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, one value per set of label values."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, labels: Tuple, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._values.items()):
+            lines.append(
+                f"{self.name}{{{_labels(self.labels, values)}}} {_number(value)}"
+            )
+        return lines
+
+
+class RequestMetrics:
+    """Latency, SQL statement count and DB time of the requests served, per route.
+
+    Routes are labelled by their path template (e.g. /stats/teams/{team_name}) rather than
+    the requested path, so the number of series stays bounded whatever is requested.
+    The metrics live in the worker process, so each worker exposes its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter(
+            "http_requests_total",
+            "Requests served, by route and status code.",
+            ("method", "route", "status"),
+        )
+        self.latency = Histogram(
+            "http_request_duration_seconds",
+            "Time from receiving a request to sending its response headers.",
+            ("method", "route"),
+            LATENCY_BUCKETS,
+        )
+        self.statements = Histogram(
+            "http_request_sql_statements",
+            "SQL statements run to serve a request.",
+            ("method", "route"),
+            STATEMENT_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "http_request_db_seconds",
+            "Time a request spent waiting on SQL statements.",
+            ("method", "route"),
+            DB_TIME_BUCKETS,
+        )
+
+    def observe(
+        self, method: str, route: str, status: int, seconds: float, queries: QueryStats
+    ):
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, seconds)
+            self.statements.observe(labels, queries.statements)
+            self.db_time.observe(labels, queries.seconds)
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.statements, self.db_time):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
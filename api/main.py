@@ -1,9 +1,50 @@
-from typing import Union
+from typing import Any, Dict, List, Union
 from db.models import *
-from db.database import engine, create_db_and_tables, create_test_data
-from sqlmodel import Session, func, select
-from fastapi import FastAPI, HTTPException, Depends
+from db.database import (
+    async_engine,
+    async_replica_engine,
+    engine,
+    create_db_and_tables,
+    create_test_data,
+    QueryStats,
+    query_stats,
+)
+from db.rollups import apply_statlines, rollup_columns, sync_rollups
+from db.season_totals import (
+    assign_season_averages,
+    recompute_season_averages,
+    sync_season_totals,
+)
+from db.aggregates import MAX_ROLLING_WINDOW, aggregate_statement, rolling_statement
+from db.slow_queries import slow_queries
+from db.metrics import compute_derived_metrics
+from db.bulk import (
+    MAX_BULK_ROWS,
+    OnConflict,
+    collapse_duplicates,
+    content_hash,
+    drop_duplicates,
+    fetch_by_ids,
+    insert_records,
+    public_columns,
+    upsert_records,
+    validate_rows,
+)
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate, page_response
+from export import MEDIA_TYPES, ExportFormat, export_lines
+from features import build_features
+from predict import batcher, feature_rows, start_predictor
+from cache import cache, player_keys, statline_keys
+from instrumentation import request_metrics
+from snapshot import snapshot
+from versioning import NotModified, conditional, versions
+from sqlmodel import Session, and_, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
+from fastapi import FastAPI, HTTPException, Body, Depends, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 import os
+import time
 from os.path import join, dirname
 from dotenv import load_dotenv
 
@@ -14,14 +55,101 @@ load_dotenv(dotenv_path)
 ENVIRONMENT = os.environ.get("ENVIRONMENT")
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    # Also used by the GET endpoints whose responses are cached (the /stats/* rollups and
+    # the feature files): they are stored under the data versions bumped by the writes, and
+    # a lagging replica would get its pre-write result cached and served under the new ETag
+    async with AsyncSession(async_engine) as session:
+        yield session
+
+
+def read_from_replica(request: Request):
+    # Responses read from a replica are sent without an ETag: it may not have applied the
+    # writes the versions count yet, and a stale body would be revalidated as current
+    if async_replica_engine is not async_engine:
+        request.state.etag = None
+
+
+async def get_read_session(request: Request):
+    # Read only endpoints are routed to the replica (the primary when there is none)
+    read_from_replica(request)
+    async with AsyncSession(async_replica_engine) as session:
         yield session
 
 
 app = FastAPI()
 
 
+# === Multi-get ===
+def parse_ids(ids: str) -> List[UUID]:
+    """Parses the comma separated ids of a multi-get query string, 400 if one is invalid."""
+    try:
+        parsed = [UUID(id.strip()) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid id in ids")
+    if len(parsed) > MAX_BULK_ROWS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BULK_ROWS} ids can be requested"
+        )
+    return parsed
+
+
+async def lookup(
+    session: AsyncSession, statement, table_model, ids: List[UUID], read_model=None
+):
+    """Fetches many records by id in one query, see fetch_by_ids.
+
+    Returns `data`, the records in the order of the ids with null for the ids that were
+    not found, and `not_found`, the ids that were not found. The records are returned as
+    read_model (e.g. PlayerRead) when one is given, the table model's own fields otherwise.
+    """
+    records, not_found = await session.run_sync(
+        fetch_by_ids, statement, table_model, ids
+    )
+    if read_model is not None:
+        records = [record and read_model.from_orm(record) for record in records]
+    return {"data": records, "not_found": not_found}
+
+
+# === Conditional Requests ===
+@app.exception_handler(NotModified)
+async def not_modified(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag})
+
+
+@app.middleware("http")
+async def add_etag_header(request: Request, call_next):
+    response = await call_next(request)
+    etag = getattr(request.state, "etag", None)
+    if etag and response.status_code == 200:
+        response.headers["ETag"] = etag
+    return response
+
+
+# === Metrics ===
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    # Added last so it wraps the other middlewares and times the whole request
+    queries = QueryStats(f"{request.method} {request.url.path}")
+    token = query_stats.set(queries)
+    began = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        query_stats.reset(token)
+        route = request.scope.get("route")
+        request_metrics.observe(
+            request.method,
+            route.path if route is not None else "unmatched",
+            status,
+            time.perf_counter() - began,
+            queries,
+        )
+
+
 # === Startup Function ===
 @app.on_event("startup")
 def on_startup():
@@ -31,10 +159,32 @@ def on_startup():
         print("Loading Test Data...")
         create_test_data()
 
+    with Session(engine) as session:
+        versions.create(session)
+        sync_rollups(session)
+        sync_season_totals(session)
+        if snapshot is not None:
+            snapshot.load(session)
+
+
+@app.on_event("startup")
+async def on_startup_predictor():
+    # The batcher's task has to be started from the event loop
+    start_predictor()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await batcher.stop()
+    # Pooled connections have to be closed, aiosqlite's worker threads would keep the
+    # process alive otherwise
+    await async_engine.dispose()
+    await async_replica_engine.dispose()
+
 
 # === API Information ===
-@app.get("/")
-def root():
+@app.get("/", dependencies=[conditional()])
+async def root():
     return {
         "Version": "0.0.1",
         "Author": "@naterobertstech",
@@ -45,54 +195,227 @@ def root():
 # region Player
 
 
-@app.get("/players/")
-def read_players(*, session: Session = Depends(get_session)):
-    players = session.exec(select(Player).order_by(Player.full_name)).all()
-    return players
+def include_stats(
+    statement,
+    include: Optional[PlayerInclude],
+    season: Optional[str],
+    opponent: Optional[str],
+):
+    """Adds the eager loading of the players' stat lines to a select of players.
+
+    The stat lines of every selected player are loaded by one more SELECT ... WHERE
+    player_id IN (...), so a page of players costs two queries however many players it has
+    instead of one lazy load per player.
 
+    Args:
+        statement: select of the players
+        include (PlayerInclude): `stats` to load the players' stat lines, nothing is added if None
+        season (str): only load the stat lines of this season
+        opponent (str): only load the stat lines against this opponent
+    """
+    if include != PlayerInclude.stats:
+        return statement
+    stats = Player.stats
+    if season is not None:
+        stats = stats.and_(StatLine.season == season)
+    if opponent is not None:
+        stats = stats.and_(StatLine.opponent == opponent)
+    return statement.options(selectinload(stats))
+
+
+@app.get("/players/", dependencies=[conditional("players", "statLines")])
+async def read_players(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    ids: Optional[str] = None,
+    include: Optional[PlayerInclude] = None,
+    season: Optional[str] = None,
+    opponent: Optional[str] = None,
+):
+    """Endpoint that returns every player, sorted by name, or the players with the given ids.
 
-@app.get("/players/{player_id}", response_model=PlayerRead)
-def read_player(*, session: Session = Depends(get_session), player_id: UUID):
-    player = session.get(Player, player_id)
+    Args:
+        ids (str): comma separated ids of the players to return, see POST /players/lookup
+        include (PlayerInclude): `stats` to nest each player's stat lines in the response
+        season (str): only nest the stat lines of this season (e.g. 2012-2013)
+        opponent (str): only nest the stat lines against this opponent
+    """
+    if ids is not None:
+        return await lookup_players(session, parse_ids(ids), include, season, opponent)
+
+    statement = include_stats(
+        select(Player).order_by(Player.full_name), include, season, opponent
+    )
+    players = (await session.exec(statement)).all()
+    if include == PlayerInclude.stats:
+        # Relationships are left out of the players' own serialization
+        return [PlayerWithStatLines.from_orm(player) for player in players]
+    return [PlayerRead.from_orm(player) for player in players]
+
+
+async def lookup_players(
+    session: AsyncSession,
+    ids: List[UUID],
+    include: Optional[PlayerInclude],
+    season: Optional[str],
+    opponent: Optional[str],
+):
+    statement = include_stats(select(Player), include, season, opponent)
+    read_model = PlayerWithStatLines if include == PlayerInclude.stats else PlayerRead
+    return await lookup(session, statement, Player, ids, read_model)
+
+
+@app.post("/players/lookup", dependencies=[conditional("players", "statLines")])
+async def read_players_by_ids(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    ids: List[UUID] = Body(..., embed=True, max_items=MAX_BULK_ROWS),
+    include: Optional[PlayerInclude] = None,
+    season: Optional[str] = None,
+    opponent: Optional[str] = None,
+):
+    """Endpoint that returns many players by id, for lists of ids too long for GET /players/?ids=.
+
+    Args:
+        ids (List[UUID]): ids of the players to return, as `{"ids": [...]}`
+        include (PlayerInclude): `stats` to nest each player's stat lines in the response
+        season (str): only nest the stat lines of this season (e.g. 2012-2013)
+        opponent (str): only nest the stat lines against this opponent
+
+    Returns `data`, the players in the order of the ids with null for the ids that were
+    not found, and `not_found`, the ids that were not found.
+    """
+    return await lookup_players(session, ids, include, season, opponent)
+
+
+@app.get("/players/{player_id}", dependencies=[conditional("players", "statLines")])
+async def read_player(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    player_id: UUID,
+    include: Optional[PlayerInclude] = None,
+    season: Optional[str] = None,
+    opponent: Optional[str] = None,
+):
+    """Endpoint that returns a player as found by the players ID.
+
+    Args:
+        player_id (UUID): UUID unique to the player that is being looked for
+        include (PlayerInclude): `stats` to nest the player's stat lines in the response
+        season (str): only nest the stat lines of this season (e.g. 2012-2013)
+        opponent (str): only nest the stat lines against this opponent
+    """
+    statement = include_stats(
+        select(Player).where(Player.id == player_id), include, season, opponent
+    )
+    player = (await session.exec(statement)).first()
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
-    return player
+    if include == PlayerInclude.stats:
+        return PlayerWithStatLines.from_orm(player)
+    return PlayerRead.from_orm(player)
 
 
 @app.post("/players/", response_model=PlayerRead)
-def create_player(*, session: Session = Depends(get_session), player: PlayerCreate):
-    db_player = Player.from_orm(player)
+async def create_player(
+    *,
+    session: AsyncSession = Depends(get_session),
+    player: PlayerCreate,
+    on_conflict: Optional[OnConflict] = None,
+):
+    """Endpoint that creates a player.
 
-    # If there is a similar record determined by the unique date, raise duplicate record error
-    similar_player = session.exec(
-        select(Player.id).where(
-            Player.full_name == db_player.full_name
-            and Player.hometown_hs == db_player.hometown_hs
+    Args:
+        on_conflict (OnConflict): `update` to upsert the player onto an existing one with the
+            same name and hometown/hs instead of failing with 409
+    """
+    db_player = Player.from_orm(player)
+    db_player.content_hash = content_hash(player)
+    unique_key = and_(
+        Player.full_name == db_player.full_name,
+        Player.hometown_hs == db_player.hometown_hs,
+    )
+
+    if on_conflict == OnConflict.update:
+        await session.run_sync(
+            upsert_records,
+            Player,
+            [(0, db_player)],
+            [Player.full_name, Player.hometown_hs],
         )
-    ).all()
+        await session.run_sync(versions.bump, "players")
+        await session.commit()
+        db_player = (await session.exec(select(Player).where(unique_key))).one()
+        cache.invalidate(*player_keys(db_player))
+        return db_player
+
+    # If there is a similar record determined by the unique name and hometown, raise duplicate record error
+    similar_player = (await session.exec(select(Player.id).where(unique_key))).all()
     if similar_player:
         raise HTTPException(status_code=409, detail="Duplicate Player Record")
 
     session.add(db_player)
-    session.commit()
-    session.refresh(db_player)
+    await session.run_sync(versions.bump, "players")
+    await session.commit()
+    await session.refresh(db_player)
     return db_player
 
 
+@app.post("/players/bulk")
+async def create_players_bulk(
+    *,
+    session: AsyncSession = Depends(get_session),
+    players: List[Dict[str, Any]] = Body(..., max_items=MAX_BULK_ROWS),
+    on_conflict: Optional[OnConflict] = None,
+):
+    """Endpoint that creates many players in a single transaction.
+
+    Args:
+        players (List[dict]): players to create, each shaped like the body of POST /players/
+        on_conflict (OnConflict): `update` to upsert the players onto existing ones with the
+            same name and hometown/hs instead of reporting them as duplicates
+
+    Returns the status of every row: `created` (with its id), `upserted`, `invalid` (with
+    the validation errors) or `duplicate` (a player with the same name and hometown/hs exists).
+    """
+    statuses, records = validate_rows(players, PlayerCreate, Player)
+    unique_key = [Player.full_name, Player.hometown_hs]
+    if on_conflict == OnConflict.update:
+        await session.run_sync(upsert_records, Player, records, unique_key)
+        for index, _ in records:
+            statuses[index] = {"index": index, "status": "upserted"}
+    else:
+        records = await session.run_sync(drop_duplicates, statuses, records, unique_key)
+        await session.run_sync(insert_records, Player, records)
+
+    if records:
+        await session.run_sync(versions.bump, "players")
+        await session.commit()
+        if on_conflict == OnConflict.update:
+            cache.invalidate_routes("/stats/player", "/stats/players/{player_id}")
+    return {"rows": statuses}
+
+
 @app.patch("/players/{player_id}", response_model=PlayerRead)
-def update_player(
-    *, session: Session = Depends(get_session), player_id: UUID, player: PlayerUpdate
+async def update_player(
+    *,
+    session: AsyncSession = Depends(get_session),
+    player_id: UUID,
+    player: PlayerUpdate,
 ):
-    db_player = session.get(Player, player_id)
+    db_player = await session.get(Player, player_id)
     if not db_player:
         raise HTTPException(status_code=404, detail="Player not found")
     player_data = player.dict(exclude_unset=True)
     for key, value in player_data.items():
         setattr(db_player, key, value)
     db_player.last_modified = datetime.datetime.utcnow()
+    db_player.content_hash = content_hash(PlayerCreate.from_orm(db_player))
     session.add(db_player)
-    session.commit()
-    session.refresh(db_player)
+    await session.run_sync(versions.bump, "players")
+    await session.commit()
+    await session.refresh(db_player)
+    cache.invalidate(*player_keys(db_player))
     return db_player
 
 
@@ -100,10 +423,12 @@ def update_player(
 
 
 # region Team
-@app.get("/teams/")
-def read_team(*, session: Session = Depends(get_session)):
-    teams = session.exec(
-        select(StatLine.opponent).distinct().order_by(StatLine.opponent)
+@app.get("/teams/", dependencies=[conditional("statLines")])
+async def read_team(*, session: AsyncSession = Depends(get_read_session)):
+    teams = (
+        await session.exec(
+            select(StatLine.opponent).distinct().order_by(StatLine.opponent)
+        )
     ).all()
     return teams
 
@@ -112,12 +437,14 @@ def read_team(*, session: Session = Depends(get_session)):
 
 
 # region Games
-@app.get("/games/")
-def read_games(*, session: Session = Depends(get_session)):
-    games = session.exec(
-        select(StatLine.date, StatLine.team, StatLine.opponent)
-        .distinct(StatLine.date)
-        .order_by(StatLine.date)
+@app.get("/games/", dependencies=[conditional("statLines")])
+async def read_games(*, session: AsyncSession = Depends(get_read_session)):
+    games = (
+        await session.exec(
+            select(StatLine.date, StatLine.team, StatLine.opponent)
+            .distinct(StatLine.date)
+            .order_by(StatLine.date)
+        )
     ).all()
     return games
 
@@ -126,10 +453,10 @@ def read_games(*, session: Session = Depends(get_session)):
 
 
 # region Seasons
-@app.get("/seasons/")
-def read_seasons(*, session: Session = Depends(get_session)):
-    seasons = session.exec(
-        select(StatLine.season).distinct().order_by(StatLine.season)
+@app.get("/seasons/", dependencies=[conditional("statLines")])
+async def read_seasons(*, session: AsyncSession = Depends(get_read_session)):
+    seasons = (
+        await session.exec(select(StatLine.season).distinct().order_by(StatLine.season))
     ).all()
     return seasons
 
@@ -138,199 +465,380 @@ def read_seasons(*, session: Session = Depends(get_session)):
 
 
 # region Stats
-@app.get("/stats/")
-def read_statline(*, session: Session = Depends(get_session)):
-    teams = session.exec(select(StatLine)).all()
-    return teams
+@app.get("/stats/", dependencies=[conditional("statLines")])
+async def read_statline(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    after: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ids: Optional[str] = None,
+):
+    """Endpoint that returns a page of stat lines ordered by game date.
+
+    Args:
+        after (str): cursor returned as `next_cursor` by the previous page
+        limit (int): max number of stat lines on the page
+        ids (str): comma separated ids of the stat lines to return instead of a page, see
+            POST /stats/lookup
+    """
+    if ids is not None:
+        return await lookup(session, select(StatLine), StatLine, parse_ids(ids))
+
+    result = await session.execute(
+        paginate(select(*public_columns(StatLine)), StatLine, after, limit)
+    )
+    return page_response(result, limit)
+
+
+@app.post("/stats/lookup", dependencies=[conditional("statLines")])
+async def read_statlines_by_ids(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    ids: List[UUID] = Body(..., embed=True, max_items=MAX_BULK_ROWS),
+):
+    """Endpoint that returns many stat lines by id, for lists of ids too long for GET /stats/?ids=.
+
+    Args:
+        ids (List[UUID]): ids of the stat lines to return, as `{"ids": [...]}`
+
+    Returns `data`, the stat lines in the order of the ids with null for the ids that
+    were not found, and `not_found`, the ids that were not found.
+    """
+    return await lookup(session, select(StatLine), StatLine, ids)
+
+
+@app.get(
+    "/stats/export",
+    dependencies=[conditional("statLines"), Depends(read_from_replica)],
+)
+@app.get(
+    "/stats/export.{format}",
+    dependencies=[conditional("statLines"), Depends(read_from_replica)],
+)
+async def export_statlines(*, format: ExportFormat = ExportFormat.ndjson):
+    """Endpoint that streams every stat line without loading the table into memory.
+
+    The format is given as a query param or as the extension of the path, e.g.
+    /stats/export.parquet. Arrow and Parquet exports have a typed column per field and
+    can be loaded zero-copy into pandas or Polars.
+
+    Args:
+        format (ExportFormat): `ndjson` (default), `csv`, `arrow` (IPC stream) or `parquet`
+    """
+    return StreamingResponse(
+        export_lines(StatLine, format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="statlines.{format.value}"'
+        },
+    )
 
 
 @app.post("/stats/", response_model=StatLineRead)
-def create_statline(
-    *, session: Session = Depends(get_session), statline: StatLineCreate
+async def create_statline(
+    *, session: AsyncSession = Depends(get_session), statline: StatLineCreate
 ):
     db_statline = StatLine.from_orm(statline)
+    compute_derived_metrics(db_statline)
     session.add(db_statline)
-    session.commit()
-    session.refresh(db_statline)
+    await session.run_sync(apply_statlines, added=[db_statline])
+    await session.run_sync(versions.bump, "statLines")
+    await session.commit()
+    await session.refresh(db_statline)
+    cache.invalidate(*statline_keys(db_statline))
+    if snapshot is not None:
+        snapshot.put([db_statline])
     return db_statline
 
 
+@app.post("/stats/bulk")
+async def create_statlines_bulk(
+    *,
+    session: AsyncSession = Depends(get_session),
+    statlines: List[Dict[str, Any]] = Body(..., max_items=MAX_BULK_ROWS),
+):
+    """Endpoint that creates many stat lines in a single transaction.
+
+    Args:
+        statlines (List[dict]): stat lines to create, each shaped like the body of POST /stats/
+
+    Returns the status of every row: `created` (with its id) or `invalid` (with the
+    validation errors).
+    """
+    statuses, records = validate_rows(statlines, StatLineCreate, StatLine)
+    for _, record in records:
+        compute_derived_metrics(record)
+    if records:
+        await session.run_sync(insert_records, StatLine, records)
+        await session.run_sync(apply_statlines, added=[record for _, record in records])
+        await session.run_sync(versions.bump, "statLines")
+        await session.commit()
+        cache.invalidate(
+            *{key for _, record in records for key in statline_keys(record)}
+        )
+        if snapshot is not None:
+            snapshot.put([record for _, record in records])
+    return {"rows": statuses}
+
+
 @app.patch("/stats/{statline_id}", response_model=StatLineRead)
-def update_statline(
+async def update_statline(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     statline_id: UUID,
-    statline: StatLineUpdate
+    statline: StatLineUpdate,
 ):
-    db_statline = session.get(StatLine, statline_id)
+    db_statline = await session.get(StatLine, statline_id)
     if not db_statline:
         raise HTTPException(status_code=404, detail="statline not found")
+    previous_statline = StatLine.from_orm(db_statline)
     statline_data = statline.dict(exclude_unset=True)
     for key, value in statline_data.items():
         setattr(db_statline, key, value)
+    compute_derived_metrics(db_statline)
     db_statline.last_modified = datetime.datetime.utcnow()
     session.add(db_statline)
-    session.commit()
-    session.refresh(db_statline)
+    await session.run_sync(
+        apply_statlines, added=[db_statline], removed=[previous_statline]
+    )
+    await session.run_sync(versions.bump, "statLines")
+    await session.commit()
+    await session.refresh(db_statline)
+    cache.invalidate(*statline_keys(db_statline), *statline_keys(previous_statline))
+    if snapshot is not None:
+        snapshot.put([db_statline])
     return db_statline
 
 
+# region Stats Aggregate
+@app.get("/stats/aggregate", dependencies=[conditional("statLines", "players")])
+async def get_aggregate_stats(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    group_by: Optional[str] = None,
+    fields: Optional[str] = None,
+    where: List[str] = Query(default=[]),
+):
+    """Endpoint that aggregates the requested stats over any combination of dimensions.
+
+    Args:
+        group_by (str): comma separated dimensions out of player, opponent, season and game
+            (e.g. `player,season`), the totals of all stat lines when left out
+        fields (str): comma separated stats to aggregate (e.g. `pts,ast,fg_pct`), all of them
+            when left out
+        where (List[str]): filters as `dimension:value`, can be repeated
+            (e.g. `where=season:2012-2013&where=opponent:Salisbury University`)
+    """
+    try:
+        statement = aggregate_statement(group_by, fields, where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return (await session.execute(statement)).mappings().all()
+
+
+# endregion Stats Aggregate
+
+
 # region Stats Player
-@app.get("/stats/player")
-def get_all_stats_all_players(*, session: Session = Depends(get_session)):
+async def with_player_names(session: AsyncSession, player_stats: list):
+    """Adds the players' names to the player rollups of the snapshot, sorted by name."""
+    player_ids = [row["player_id"] for row in player_stats]
+    names = dict(
+        (
+            await session.exec(
+                select(Player.id, Player.full_name).where(Player.id.in_(player_ids))
+            )
+        ).all()
+    )
+    # Like the join of the SQL path, stat lines of unknown players are left out
+    player_stats = [
+        {"full_name": names[row["player_id"]], **row}
+        for row in player_stats
+        if row["player_id"] in names
+    ]
+    return sorted(player_stats, key=lambda row: row["full_name"])
+
+
+@app.get("/stats/player", dependencies=[conditional("statLines", "players")])
+async def get_all_stats_all_players(
+    *, request: Request, session: AsyncSession = Depends(get_session)
+):
     """
     Endpoint that returns the aggregated stats of each CNU player.
     """
-    player_stats = session.exec(
-        select(
-            Player.full_name,
-            StatLine.player_id,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        )
-        .join(Player)
-        .group_by(Player.full_name)
-    ).all()
-
+    key = ("/stats/player",)
+    # Cached under the data versions the ETag was built from: a write committed while the
+    # query runs, by any worker, bumps them and later requests miss the entry
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        player_stats = await with_player_names(session, snapshot.rows("player"))
+    else:
+        player_stats = (
+            await session.exec(
+                select(
+                    Player.full_name,
+                    PlayerRollup.player_id,
+                    *rollup_columns(PlayerRollup),
+                )
+                .join(Player)
+                .order_by(Player.full_name)
+            )
+        ).all()
+
+    cache.set(key, player_stats, version)
     return player_stats
 
 
-@app.get("/stats/players/{player_id}")
-def get_all_stats_by_player(
-    *, session: Session = Depends(get_session), player_id: UUID
+@app.get(
+    "/stats/players/{player_id}",
+    dependencies=[conditional("statLines", "players")],
+)
+async def get_all_stats_by_player(
+    *, request: Request, session: AsyncSession = Depends(get_session), player_id: UUID
 ):
     """Endpoint that returns the stats of an individual CNU player as found by the players ID.
 
     Args:
         player_id (UUID): UUID unique to the player that is being looked for
     """
-    player_stats = session.exec(
-        select(
-            Player.full_name,
-            StatLine.player_id,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
+    key = ("/stats/players/{player_id}", player_id)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        player_stats = await with_player_names(
+            session, snapshot.rows("player", player_id)
         )
-        .where(StatLine.player_id == player_id)
-        .join(Player)
-        .group_by(Player.full_name)
-    ).all()
+    else:
+        player_stats = (
+            await session.exec(
+                select(
+                    Player.full_name,
+                    PlayerRollup.player_id,
+                    *rollup_columns(PlayerRollup),
+                )
+                .where(PlayerRollup.player_id == player_id)
+                .join(Player)
+            )
+        ).all()
 
     if not player_stats:
         raise HTTPException(
             status_code=404, detail="Stats for Player requested not found"
         )
 
+    cache.set(key, player_stats, version)
     return player_stats
 
 
+@app.get(
+    "/stats/players/{player_id}/rolling",
+    dependencies=[conditional("statLines")],
+)
+async def get_rolling_stats_by_player(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    player_id: UUID,
+    window: int = Query(default=5, ge=1, le=MAX_ROLLING_WINDOW),
+    fields: Optional[str] = None,
+    mode: RollingMode = RollingMode.rolling,
+    season: Optional[str] = None,
+):
+    """Endpoint that returns a player's stats over a moving window of games, game by game.
+
+    Args:
+        player_id (UUID): UUID unique to the player that is being looked for
+        window (int): number of games averaged, the game and the ones before it
+        fields (str): comma separated stats (e.g. `pts,ast,fg_pct`), all of them when
+            left out
+        mode (RollingMode): `rolling` for the last `window` games, `cumulative` for the
+            season to date
+        season (str): only return the games of this season
+    """
+    try:
+        statement = rolling_statement(player_id, fields, window, mode, season)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rolling_stats = (await session.execute(statement)).mappings().all()
+    if not rolling_stats:
+        raise HTTPException(
+            status_code=404, detail="Stats for Player requested not found"
+        )
+    return rolling_stats
+
+
 # endregion Stats Player
 
 
 # region Stats Team
-@app.get("/stats/teams")
-def get_all_stats_all_teams(*, session: Session = Depends(get_session)):
+@app.get("/stats/teams", dependencies=[conditional("statLines")])
+async def get_all_stats_all_teams(
+    *, request: Request, session: AsyncSession = Depends(get_session)
+):
     """
     Endpoint that returns the aggregated stats of CNU Players against each team.
     """
-    # season_stats = (session.query(StatLine).group_by(StatLine.season).order_by(StatLine.season))
-    team_stats = session.exec(
-        select(
-            StatLine.opponent,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        ).group_by(StatLine.opponent)
-    ).all()
-
+    key = ("/stats/teams",)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        team_stats = snapshot.rows("opponent")
+    else:
+        team_stats = (
+            await session.exec(
+                select(TeamRollup.opponent, *rollup_columns(TeamRollup)).order_by(
+                    TeamRollup.opponent
+                )
+            )
+        ).all()
+
+    cache.set(key, team_stats, version)
     return team_stats
 
 
-@app.get("/stats/teams/{team_name}")
-def get_all_stats_by_team(*, session: Session = Depends(get_session), team_name: str):
+@app.get("/stats/teams/{team_name}", dependencies=[conditional("statLines")])
+async def get_all_stats_by_team(
+    *, request: Request, session: AsyncSession = Depends(get_session), team_name: str
+):
     """Endpoint that returns all of the stats of CNU against an individual opponent as found by the team name.
 
     Args:
         team_name (str): string representation of the team (the opponent) that is being looked for
     """
-    team_stats = session.exec(
-        select(
-            StatLine.opponent,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        )
-        .where(StatLine.opponent == team_name)
-        .group_by(StatLine.opponent)
-    ).all()
+    key = ("/stats/teams/{team_name}", team_name)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        team_stats = snapshot.rows("opponent", team_name)
+    else:
+        team_stats = (
+            await session.exec(
+                select(TeamRollup.opponent, *rollup_columns(TeamRollup)).where(
+                    TeamRollup.opponent == team_name
+                )
+            )
+        ).all()
 
     if not team_stats:
         raise HTTPException(
             status_code=404, detail="Stats for Team requested not found"
         )
 
+    cache.set(key, team_stats, version)
     return team_stats
 
 
@@ -338,79 +846,66 @@ def get_all_stats_by_team(*, session: Session = Depends(get_session), team_name:
 
 
 # region Stats Season
-@app.get("/stats/season")
-def get_all_stats_all_seasons(*, session: Session = Depends(get_session)):
+@app.get("/stats/season", dependencies=[conditional("statLines")])
+async def get_all_stats_all_seasons(
+    *, request: Request, session: AsyncSession = Depends(get_session)
+):
     """
     Endpoint that returns the aggregated stats of CNU for each season.
     """
-    # season_stats = (session.query(StatLine).group_by(StatLine.season).order_by(StatLine.season))
-    season_stats = session.exec(
-        select(
-            StatLine.season,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        ).group_by(StatLine.season)
-    ).all()
-
+    key = ("/stats/season",)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        season_stats = snapshot.rows("season")
+    else:
+        season_stats = (
+            await session.exec(
+                select(SeasonRollup.season, *rollup_columns(SeasonRollup)).order_by(
+                    SeasonRollup.season
+                )
+            )
+        ).all()
+
+    cache.set(key, season_stats, version)
     return season_stats
 
 
-@app.get("/stats/season/{season_year}")
-def get_all_stats_by_season(
-    *, session: Session = Depends(get_session), season_year: str
+@app.get("/stats/season/{season_year}", dependencies=[conditional("statLines")])
+async def get_all_stats_by_season(
+    *, request: Request, session: AsyncSession = Depends(get_session), season_year: str
 ):
     """Endpoint that returns the stats of CNU in an individual season as found by the season years.
 
     Args:
         season_years (str): years of the season (e.g. 2012-2013) that is being looked for.
     """
-    season_stats = session.exec(
-        select(
-            StatLine.season,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        )
-        .where(StatLine.season == season_year)
-        .group_by(StatLine.season)
-    ).all()
+    key = ("/stats/season/{season_year}", season_year)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        season_stats = snapshot.rows("season", season_year)
+    else:
+        season_stats = (
+            await session.exec(
+                select(SeasonRollup.season, *rollup_columns(SeasonRollup)).where(
+                    SeasonRollup.season == season_year
+                )
+            )
+        ).all()
 
     if not season_stats:
         raise HTTPException(
             status_code=404, detail="Stats for Season requested not found"
         )
 
+    cache.set(key, season_stats, version)
     return season_stats
 
 
@@ -418,83 +913,75 @@ def get_all_stats_by_season(
 
 
 # region Stats Game
-@app.get("/stats/games")
-def get_all_stats_all_games(*, session: Session = Depends(get_session)):
+@app.get("/stats/games", dependencies=[conditional("statLines")])
+async def get_all_stats_all_games(
+    *, request: Request, session: AsyncSession = Depends(get_session)
+):
     """
     Endpoint that returns the aggregated stats of CNU each game.
     """
-
-    game_stats = session.exec(
-        select(
-            StatLine.date,
-            StatLine.team,
-            StatLine.opponent,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        ).group_by(StatLine.date)
-    ).all()
-
+    key = ("/stats/games",)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        game_stats = snapshot.rows("game")
+    else:
+        game_stats = (
+            await session.exec(
+                select(
+                    GameRollup.date,
+                    GameRollup.team,
+                    GameRollup.opponent,
+                    *rollup_columns(GameRollup),
+                ).order_by(GameRollup.date)
+            )
+        ).all()
+
+    cache.set(key, game_stats, version)
     return game_stats
 
 
-@app.get("/stats/games/{game_date}")
-def get_all_stats_by_game(
-    *, session: Session = Depends(get_session), game_date: datetime.date
+@app.get("/stats/games/{game_date}", dependencies=[conditional("statLines")])
+async def get_all_stats_by_game(
+    *,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    game_date: datetime.date,
 ):
     """Endpoint that returns the stats of CNU in an individual game as found by the game date.
 
     Args:
         game_date (str): date of the game that was played (e.g. 01-01-2012) that is being looked for.
     """
-    game_stats = session.exec(
-        select(
-            StatLine.date,
-            StatLine.team,
-            StatLine.opponent,
-            func.sum(StatLine.ftm).label("ftm"),
-            func.sum(StatLine.fta).label("fta"),
-            func.avg(StatLine.ft_pct).label("ft_pct"),
-            func.sum(StatLine.fga).label("fga"),
-            func.sum(StatLine.fgm).label("fgm"),
-            func.avg(StatLine.fg_pct).label("fg_pct"),
-            func.sum(StatLine.three_fga).label("three_fga"),
-            func.sum(StatLine.three_fgm).label("three_fgm"),
-            func.avg(StatLine.three_pt_pct).label("three_pt_pct"),
-            func.sum(StatLine.off_reb).label("off_reb"),
-            func.sum(StatLine.def_reb).label("def_reb"),
-            func.sum(StatLine.tot_reb).label("tot_reb"),
-            func.sum(StatLine.pf).label("pf"),
-            func.sum(StatLine.ast).label("ast"),
-            func.sum(StatLine.to).label("to"),
-            func.sum(StatLine.blk).label("blk"),
-            func.sum(StatLine.stl).label("stl"),
-            func.sum(StatLine.pts).label("pts"),
-        )
-        .where(StatLine.date == game_date)
-        .group_by(StatLine.date)
-    ).all()
+    key = ("/stats/games/{game_date}", game_date)
+    version = request.state.versions
+    cached = cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    if snapshot is not None:
+        game_stats = snapshot.rows("game", game_date)
+    else:
+        game_stats = (
+            await session.exec(
+                select(
+                    GameRollup.date,
+                    GameRollup.team,
+                    GameRollup.opponent,
+                    *rollup_columns(GameRollup),
+                ).where(GameRollup.date == game_date)
+            )
+        ).all()
 
     if not game_stats:
         raise HTTPException(
             status_code=404, detail="Stats for Game requested not found"
         )
 
+    cache.set(key, game_stats, version)
     return game_stats
 
 
@@ -504,37 +991,349 @@ def get_all_stats_by_game(
 
 
 # region Game Stats
-@app.get("/gamestats/")
-def read_gamestats(*, session: Session = Depends(get_session)):
-    gamestats = session.exec(select(GameStat)).all()
-    return gamestats
+@app.get("/gamestats/", dependencies=[conditional("gamestats")])
+async def read_gamestats(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    after: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ids: Optional[str] = None,
+):
+    """Endpoint that returns a page of game stats ordered by game date.
+
+    Args:
+        after (str): cursor returned as `next_cursor` by the previous page
+        limit (int): max number of game stats on the page
+        ids (str): comma separated ids of the game stats to return instead of a page, see
+            POST /gamestats/lookup
+    """
+    if ids is not None:
+        return await lookup(
+            session, select(GameStat), GameStat, parse_ids(ids), GameStatRead
+        )
+
+    result = await session.execute(
+        paginate(select(*public_columns(GameStat)), GameStat, after, limit)
+    )
+    return page_response(result, limit)
+
+
+@app.post("/gamestats/lookup", dependencies=[conditional("gamestats")])
+async def read_gamestats_by_ids(
+    *,
+    session: AsyncSession = Depends(get_read_session),
+    ids: List[UUID] = Body(..., embed=True, max_items=MAX_BULK_ROWS),
+):
+    """Endpoint that returns many game stats by id, for lists of ids too long for GET /gamestats/?ids=.
+
+    Args:
+        ids (List[UUID]): ids of the game stats to return, as `{"ids": [...]}`
+
+    Returns `data`, the game stats in the order of the ids with null for the ids that
+    were not found, and `not_found`, the ids that were not found.
+    """
+    return await lookup(session, select(GameStat), GameStat, ids, GameStatRead)
+
 
+@app.get(
+    "/gamestats/export",
+    dependencies=[conditional("gamestats"), Depends(read_from_replica)],
+)
+@app.get(
+    "/gamestats/export.{format}",
+    dependencies=[conditional("gamestats"), Depends(read_from_replica)],
+)
+async def export_gamestats(*, format: ExportFormat = ExportFormat.ndjson):
+    """Endpoint that streams every game stat without loading the table into memory.
 
-@app.get("/gamestats/{gamestats_id}", response_model=GameStatRead)
-def read_gamestat(*, gamestat_id: int, session: Session = Depends(get_session)):
-    gamestat = session.get(GameStat, gamestat_id)
+    The format is given as a query param or as the extension of the path, e.g.
+    /gamestats/export.parquet. Arrow and Parquet exports have a typed column per field and
+    can be loaded zero-copy into pandas or Polars.
+
+    Args:
+        format (ExportFormat): `ndjson` (default), `csv`, `arrow` (IPC stream) or `parquet`
+    """
+    return StreamingResponse(
+        export_lines(GameStat, format),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="gamestats.{format.value}"'
+        },
+    )
+
+
+@app.get("/gamestats/features.npy", dependencies=[conditional("gamestats")])
+async def read_gamestat_features(
+    *,
+    session: AsyncSession = Depends(get_session),
+    season: List[str] = Query(default=[]),
+):
+    """Endpoint that returns the game stats as a float32 feature matrix in the .npy format.
+
+    The rows are the games ordered by date and the columns are listed by
+    /gamestats/features.json. The file is built once per version of the game stats and
+    cached on disk, it can be opened with np.load(path, mmap_mode="r").
+
+    Args:
+        season (List[str]): only include the games of these seasons (e.g. 2012-2013),
+            repeat the param for several seasons
+    """
+    paths = await session.run_sync(build_features, season)
+    return FileResponse(
+        paths["features"],
+        media_type="application/octet-stream",
+        filename="features.npy",
+    )
+
+
+@app.get("/gamestats/labels.npy", dependencies=[conditional("gamestats")])
+async def read_gamestat_labels(
+    *,
+    session: AsyncSession = Depends(get_session),
+    season: List[str] = Query(default=[]),
+):
+    """Endpoint that returns the `win` label of every row of /gamestats/features.npy as a float32 vector.
+
+    Args:
+        season (List[str]): only include the games of these seasons (e.g. 2012-2013)
+    """
+    paths = await session.run_sync(build_features, season)
+    return FileResponse(
+        paths["labels"], media_type="application/octet-stream", filename="labels.npy"
+    )
+
+
+@app.get("/gamestats/features.json", dependencies=[conditional("gamestats")])
+async def read_gamestat_features_manifest(
+    *,
+    session: AsyncSession = Depends(get_session),
+    season: List[str] = Query(default=[]),
+):
+    """Endpoint that returns the manifest of /gamestats/features.npy.
+
+    It lists the columns in order, the label, the shape and the date of every row. The
+    columns are the post-game box score, the label follows from its scoring columns.
+
+    Args:
+        season (List[str]): only include the games of these seasons (e.g. 2012-2013)
+    """
+    paths = await session.run_sync(build_features, season)
+    return FileResponse(paths["manifest"], media_type="application/json")
+
+
+@app.get(
+    "/gamestats/{gamestat_id}",
+    response_model=GameStatRead,
+    dependencies=[conditional("gamestats")],
+)
+async def read_gamestat(
+    *, gamestat_id: UUID, session: AsyncSession = Depends(get_read_session)
+):
+    gamestat = await session.get(GameStat, gamestat_id)
     if not gamestat:
         raise HTTPException(status_code=404, detail="Game Stat not found")
     return gamestat
 
 
 @app.post("/gamestats/", response_model=GameStatRead)
-def create_gamestat(
-    *, gamestat: GameStatCreate, session: Session = Depends(get_session)
+async def create_gamestat(
+    *,
+    gamestat: GameStatCreate,
+    session: AsyncSession = Depends(get_session),
+    on_conflict: Optional[OnConflict] = None,
 ):
+    """Endpoint that creates a game stat.
+
+    Its ppg_avg, rb_avg, opp_ppg_avg and opp_rb_avg are set to the season to date averages,
+    and the averages of the season's later games are updated if it is not the last one.
+
+    Args:
+        on_conflict (OnConflict): `update` to upsert the game stat onto an existing one on the
+            same date instead of failing with 409
+    """
     db_gamestat = GameStat.from_orm(gamestat)
+    db_gamestat.content_hash = content_hash(gamestat)
+
+    if on_conflict == OnConflict.update:
+        recompute = await session.run_sync(
+            assign_season_averages, [db_gamestat], replacing=True
+        )
+        await session.run_sync(
+            upsert_records, GameStat, [(0, db_gamestat)], [GameStat.date]
+        )
+        await session.run_sync(recompute_season_averages, recompute)
+        await session.run_sync(versions.bump, "gamestats")
+        await session.commit()
+        return (
+            await session.exec(
+                select(GameStat).where(GameStat.date == db_gamestat.date)
+            )
+        ).one()
 
     # If there is a similar record determined by the unique date, raise duplicate record error
-    similar_game = session.exec(
-        select(GameStat.date).where(GameStat.date == db_gamestat.date)
+    similar_game = (
+        await session.exec(
+            select(GameStat.date).where(GameStat.date == db_gamestat.date)
+        )
     ).all()
     if similar_game:
         raise HTTPException(status_code=409, detail="Duplicate Game Stat Record")
 
+    recompute = await session.run_sync(assign_season_averages, [db_gamestat])
     session.add(db_gamestat)
-    session.commit()
-    session.refresh(db_gamestat)
+    await session.run_sync(recompute_season_averages, recompute)
+    await session.run_sync(versions.bump, "gamestats")
+    await session.commit()
+    await session.refresh(db_gamestat)
     return db_gamestat
 
 
+@app.post("/gamestats/bulk")
+async def create_gamestats_bulk(
+    *,
+    session: AsyncSession = Depends(get_session),
+    gamestats: List[Dict[str, Any]] = Body(..., max_items=MAX_BULK_ROWS),
+    on_conflict: Optional[OnConflict] = None,
+):
+    """Endpoint that creates many game stats in a single transaction.
+
+    Args:
+        gamestats (List[dict]): game stats to create, each shaped like the body of POST /gamestats/
+        on_conflict (OnConflict): `update` to upsert the game stats onto existing ones on the
+            same date instead of reporting them as duplicates
+
+    Returns the status of every row: `created` (with its id), `upserted`, `invalid` (with
+    the validation errors) or `duplicate` (a game stat on the same date exists, or with
+    `update` a later row of the batch has the same date and replaces it). The season to
+    date averages are maintained like POST /gamestats/ does.
+    """
+    statuses, records = validate_rows(gamestats, GameStatCreate, GameStat)
+    if on_conflict == OnConflict.update:
+        records = collapse_duplicates(statuses, records, [GameStat.date])
+        recompute = await session.run_sync(
+            assign_season_averages,
+            [record for _, record in records],
+            replacing=True,
+        )
+        await session.run_sync(upsert_records, GameStat, records, [GameStat.date])
+        for index, _ in records:
+            statuses[index] = {"index": index, "status": "upserted"}
+    else:
+        records = await session.run_sync(
+            drop_duplicates, statuses, records, [GameStat.date]
+        )
+        recompute = await session.run_sync(
+            assign_season_averages, [record for _, record in records]
+        )
+        await session.run_sync(insert_records, GameStat, records)
+    await session.run_sync(recompute_season_averages, recompute)
+
+    if records:
+        await session.run_sync(versions.bump, "gamestats")
+        await session.commit()
+    return {"rows": statuses}
+
+
 # endregion Game Stats
+
+
+# region Predict
+async def predict_rows(features):
+    if batcher.model is None:
+        raise HTTPException(
+            status_code=503, detail="No model is loaded, set MODEL_PATH"
+        )
+    return (await batcher.predict(features)).tolist()
+
+
+@app.post("/predict/games")
+async def predict_games(
+    *,
+    gamestats: Union[List[GameStatCreate], GameStatCreate] = Body(...),
+):
+    """Endpoint that scores game stats with the model loaded from MODEL_PATH.
+
+    Concurrent requests are micro-batched into a single call of the model, see
+    PREDICT_MAX_BATCH and PREDICT_MAX_WAIT_MS. The features are the columns of
+    /gamestats/features.npy, the post-game box score of the game.
+
+    Args:
+        gamestats (GameStatCreate): game stat to score, or a list of them
+
+    Returns the `predictions` in the order of the game stats, the probability of a win
+    for a classifier. An empty list is answered without queueing anything.
+    """
+    if not isinstance(gamestats, list):
+        gamestats = [gamestats]
+    if not gamestats:
+        return {"predictions": []}
+    return {"predictions": await predict_rows(feature_rows(gamestats))}
+
+
+@app.get("/predict/games/{game_date}")
+async def predict_game(
+    *, session: AsyncSession = Depends(get_read_session), game_date: datetime.date
+):
+    """Endpoint that scores the game stat stored on a date.
+
+    Args:
+        game_date (str): date of the game (e.g. 2012-01-01)
+    """
+    gamestat = (
+        await session.exec(select(GameStat).where(GameStat.date == game_date))
+    ).first()
+    if not gamestat:
+        raise HTTPException(status_code=404, detail="Game Stat not found")
+    predictions = await predict_rows(feature_rows([gamestat]))
+    return {"date": game_date, "prediction": predictions[0]}
+
+
+# endregion Predict
+
+
+# region Admin
+@app.get("/admin/cache")
+async def read_cache_stats():
+    """
+    Endpoint that returns the size and hit/miss counters of the aggregate response cache.
+    """
+    return cache.stats()
+
+
+@app.get("/admin/predict")
+async def read_predict_stats():
+    """
+    Endpoint that returns the number of batches and rows scored by the prediction model.
+    """
+    return batcher.stats()
+
+
+@app.get("/admin/slow-queries")
+async def read_slow_queries():
+    """
+    Endpoint that returns the statements that took longer than SLOW_QUERY_MS, newest first,
+    with their parameters, the request that ran them and their query plan.
+    """
+    return slow_queries.stats()
+
+
+@app.delete("/admin/slow-queries", status_code=204)
+async def clear_slow_queries():
+    """
+    Endpoint that empties the slow query log.
+    """
+    slow_queries.clear()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Endpoint that returns the latency, SQL statement count and DB time of every route in
+    the Prometheus text format.
+    """
+    return PlainTextResponse(
+        request_metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+# endregion Admin
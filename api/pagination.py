@@ -0,0 +1,89 @@
+import base64
+import datetime
+import json
+from typing import Optional, Tuple
+from uuid import UUID
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlmodel import and_, or_
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(date: datetime.date, id: UUID) -> str:
+    """Encodes the (date, id) position of a row as an opaque cursor token.
+
+    Args:
+        date (datetime.date): date of the last row on the page
+        id (UUID): id of the last row on the page, used to break ties on the date
+    """
+    raw = json.dumps([date.isoformat(), id.hex]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.date, UUID]:
+    """Decodes a cursor token created by encode_cursor back into its (date, id) position.
+
+    Args:
+        cursor (str): opaque cursor token sent back by the client as `after`
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.date.fromisoformat(date), UUID(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def paginate(statement, model, after: Optional[str], limit: int):
+    """Applies keyset pagination on (date, id) to a select statement.
+
+    Rows are filtered to the ones after the cursor instead of using an OFFSET, so every
+    page costs the same to read no matter how deep into the table it is. One extra row
+    is requested so that page() can tell if there is a next page.
+
+    Args:
+        statement: select statement over the model
+        model: table model with `date` and `id` columns (e.g. StatLine, GameStat)
+        after (str): cursor returned with the previous page, None for the first page
+        limit (int): number of rows on the page
+    """
+    if after:
+        date, id = decode_cursor(after)
+        statement = statement.where(
+            or_(model.date > date, and_(model.date == date, model.id > id))
+        )
+    return statement.order_by(model.date, model.id).limit(limit + 1)
+
+
+def page(rows, limit: int) -> dict:
+    """Builds the response body of a page from the rows of a paginate() query.
+
+    Args:
+        rows: rows returned by the paginated statement (up to limit + 1)
+        limit (int): number of rows on the page
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return {"data": rows, "next_cursor": next_cursor}
+
+
+def page_response(result, limit: int) -> ORJSONResponse:
+    """Builds the response of a page straight from the result of a Core paginate() query.
+
+    The rows are turned into plain dicts and encoded by orjson, bypassing the ORM objects,
+    their pydantic validation and jsonable_encoder, which cost more than the query on
+    wide tables such as gamestats. The JSON is the same as the one of page().
+
+    Args:
+        result: result of the paginated select of the model's table
+        limit (int): number of rows on the page
+    """
+    columns = list(result.keys())
+    body = page(result.all(), limit)
+    body["data"] = [dict(zip(columns, row)) for row in body["data"]]
+    return ORJSONResponse(body)
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import pickle
+import numpy as np
+from features import FEATURE_FIELDS
+
+
+# Pickled model scoring the game stats' features, e.g. a scikit-learn classifier trained on
+# /gamestats/features.npy. It is unpickled, so it must come from a trusted source.
+MODEL_PATH = os.environ.get("MODEL_PATH")
+# Largest number of rows scored by one call of the model
+PREDICT_MAX_BATCH = int(os.environ.get("PREDICT_MAX_BATCH", 256))
+# How long the first request of a batch waits for others to join it
+PREDICT_MAX_WAIT_MS = float(os.environ.get("PREDICT_MAX_WAIT_MS", 5))
+
+
+def feature_rows(gamestats) -> np.ndarray:
+    """Returns the float32 feature matrix of game stats, with the columns of /gamestats/features.npy.
+
+    Args:
+        gamestats: game stats (e.g. GameStatCreate or GameStat) to build the rows of
+    """
+    return np.array(
+        [
+            [getattr(gamestat, field) for field in FEATURE_FIELDS]
+            for gamestat in gamestats
+        ],
+        dtype=np.float32,
+    ).reshape(-1, len(FEATURE_FIELDS))
+
+
+def score(model, features: np.ndarray) -> np.ndarray:
+    """Scores feature rows, the probability of a win for classifiers with predict_proba."""
+    if hasattr(model, "predict_proba"):
+        return np.asarray(model.predict_proba(features))[:, 1]
+    return np.asarray(model.predict(features), dtype=np.float64)
+
+
+class MicroBatcher:
+    """Merges the feature rows of concurrent requests into one vectorized call of the model.
+
+    The first request to arrive opens a batch. Requests that arrive within max_wait join it
+    until it holds max_batch rows, then the whole batch is scored by a single call run in a
+    thread, so the event loop keeps accepting requests meanwhile. A request is never split
+    across batches, so a batch can go over max_batch by the rows of its last request.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.model = None
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.rows = 0
+        self._queue = None
+        self._task = None
+
+    def start(self, model):
+        self.model = model
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, features: np.ndarray) -> np.ndarray:
+        """Returns the scores of feature rows once the batch they joined has been scored."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        size = len(items[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._next_batch()
+            features = np.concatenate([rows for rows, _ in items])
+            try:
+                scores = await asyncio.to_thread(score, self.model, features)
+            except Exception as error:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.batches += 1
+            self.rows += len(features)
+            offset = 0
+            for rows, future in items:
+                if not future.done():
+                    future.set_result(scores[offset : offset + len(rows)])
+                offset += len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+def load_model(path: str):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def start_predictor():
+    """Loads the model from MODEL_PATH and starts the batcher, nothing is done if it is unset."""
+    if MODEL_PATH:
+        batcher.start(load_model(MODEL_PATH))
+
+
+batcher = MicroBatcher(PREDICT_MAX_BATCH, PREDICT_MAX_WAIT_MS / 1000)
@@ -0,0 +1,209 @@
+import os
+import threading
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import String, type_coerce
+from sqlmodel import Session, select
+from db.models import *
+from db.metrics import RATIOS
+from db.rollups import STAT_FIELDS, SUM_FIELDS
+
+
+# Keeps a columnar copy of statLines in memory and answers the /stats/* rollup endpoints
+# from it instead of the database when enabled
+STATS_SNAPSHOT = os.environ.get("STATS_SNAPSHOT", "false").lower() == "true"
+SNAPSHOT_LOAD_BATCH_SIZE = 100_000
+
+# Dimensions the snapshot groups by, with the StatLine column each one is keyed on
+DIMENSIONS = {
+    "player": "player_id",
+    "opponent": "opponent",
+    "season": "season",
+    "game": "date",
+}
+
+# Columns read for every stat line, in the order the rows are unpacked
+_COLUMNS = ["id", "team", *DIMENSIONS.values(), *SUM_FIELDS]
+
+
+class StatSnapshot:
+    """In-process columnar copy of the stat lines used to compute the rollups with NumPy.
+
+    Each counting stat is kept in its own int64 array and each dimension's key is encoded
+    as an int32 code into the list of its distinct values (-1 for a stat line without a
+    player). A group-by is then one np.bincount per stat over the codes, with no round trip
+    to the database. The write endpoints patch the snapshot after they commit: new stat
+    lines are appended and updated ones are overwritten in place.
+
+    Like the response cache, the snapshot lives in the worker process and only sees the
+    writes made through it, so it is meant for a single worker (or a read-mostly database
+    that is reloaded on restart).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.capacity = 0
+        self._positions = {}
+        self._sums = {field: np.zeros(0, dtype=np.int64) for field in SUM_FIELDS}
+        self._codes = {d: np.zeros(0, dtype=np.int32) for d in DIMENSIONS}
+        self._values = {d: {} for d in DIMENSIONS}
+        self._games = {}
+
+    def _reserve(self, size: int):
+        # Arrays grow by doubling so appending one stat line at a time stays amortized O(1)
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity, 1024)
+        for arrays in (self._sums, self._codes):
+            for name, array in arrays.items():
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                arrays[name] = grown
+        self.capacity = capacity
+
+    def _code(self, dimension: str, value) -> int:
+        if value is None:
+            return -1
+        values = self._values[dimension]
+        return values.setdefault(value, len(values))
+
+    @staticmethod
+    def _position_key(statline_id) -> str:
+        # Positions are keyed by the hex of the id, whether it was read raw or as a UUID
+        return str(statline_id).replace("-", "")
+
+    def _append(self, rows):
+        """Appends rows of the _COLUMNS values, one vectorized copy per column."""
+        if not rows:
+            return
+        start = self.size
+        end = start + len(rows)
+        self._reserve(end)
+
+        columns = dict(zip(_COLUMNS, zip(*rows)))
+        for position, statline_id in enumerate(columns["id"], start):
+            self._positions[self._position_key(statline_id)] = position
+        for date, team, opponent in zip(
+            columns["date"], columns["team"], columns["opponent"]
+        ):
+            self._games.setdefault(date, (team, opponent))
+        for dimension, column in DIMENSIONS.items():
+            values = self._values[dimension]
+            self._codes[dimension][start:end] = [
+                -1 if value is None else values.setdefault(value, len(values))
+                for value in columns[column]
+            ]
+        for field in SUM_FIELDS:
+            self._sums[field][start:end] = columns[field]
+        self.size = end
+
+    def load(self, session: Session):
+        """Replaces the snapshot with the stat lines in the database, read in batches.
+
+        The ids are read in their stored form rather than converted to a UUID per row,
+        the distinct player ids are converted once all the rows are coded.
+        """
+        table = StatLine.__table__
+        columns = [
+            type_coerce(table.c[column], String)
+            if column in ("id", "player_id")
+            else table.c[column]
+            for column in _COLUMNS
+        ]
+        with self._lock:
+            self._reset()
+            result = (
+                session.connection()
+                .execution_options(stream_results=True)
+                .execute(select(*columns))
+            )
+            for rows in result.partitions(SNAPSHOT_LOAD_BATCH_SIZE):
+                self._append(rows)
+            self._values["player"] = {
+                UUID(player_id): code
+                for player_id, code in self._values["player"].items()
+            }
+
+    def put(self, statlines):
+        """Adds new stat lines to the snapshot and overwrites the ones it already holds."""
+        with self._lock:
+            new = []
+            for statline in statlines:
+                position = self._positions.get(self._position_key(statline.id))
+                if position is None:
+                    new.append([getattr(statline, column) for column in _COLUMNS])
+                    continue
+                for dimension, column in DIMENSIONS.items():
+                    self._codes[dimension][position] = self._code(
+                        dimension, getattr(statline, column)
+                    )
+                for field in SUM_FIELDS:
+                    self._sums[field][position] = getattr(statline, field)
+                self._games.setdefault(
+                    statline.date, (statline.team, statline.opponent)
+                )
+            self._append(new)
+
+    def rows(self, dimension: str, value=None):
+        """Returns the rollups of a dimension shaped like the rows of the rollup endpoints.
+
+        Args:
+            dimension (str): one of DIMENSIONS
+            value: only return the rollup of this key (e.g. a season), all of them if None
+        """
+        with self._lock:
+            values = list(self._values[dimension])
+            codes = self._codes[dimension][: self.size]
+            keep = codes >= 0
+            codes = codes[keep]
+            lines = np.bincount(codes, minlength=len(values))
+            sums = {
+                field: np.bincount(
+                    codes,
+                    weights=self._sums[field][: self.size][keep],
+                    minlength=len(values),
+                )
+                for field in SUM_FIELDS
+            }
+            games = dict(self._games)
+            code = self._values[dimension].get(value)
+
+        # Keys whose stat lines were all moved elsewhere by updates have no lines left
+        if value is None:
+            groups = sorted(np.flatnonzero(lines), key=lambda group: values[group])
+        else:
+            groups = [code] if code is not None and lines[code] else []
+
+        totals = SimpleNamespace(**{field: sums[field][groups] for field in SUM_FIELDS})
+        columns = {
+            field: getattr(totals, field).astype(np.int64).tolist()
+            for field in SUM_FIELDS
+        }
+        for field in STAT_FIELDS:
+            if field in RATIOS:
+                numerator, denominator = RATIOS[field]
+                attempts = denominator(totals)
+                ratio = np.divide(
+                    numerator(totals),
+                    attempts,
+                    out=np.full(len(groups), np.nan),
+                    where=attempts != 0,
+                )
+                # NaN marks no attempts, returned as null like the SQL rollups
+                columns[field] = [None if np.isnan(r) else r for r in ratio.tolist()]
+
+        rows = []
+        for i, group in enumerate(groups):
+            row = {DIMENSIONS[dimension]: values[group]}
+            if dimension == "game":
+                row["team"], row["opponent"] = games[values[group]]
+            row.update({field: columns[field][i] for field in STAT_FIELDS})
+            rows.append(row)
+        return rows
+
+
+snapshot = StatSnapshot() if STATS_SNAPSHOT else None
@@ -0,0 +1,27 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+# The app modules are imported as top level modules (e.g. `db.models`), as they are when
+# the API is run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The database is configured when db.database is imported, so the tests point it at a
+# database of their own before any test module imports it
+_directory = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'api.sqlite3')}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ.pop("ENVIRONMENT", None)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,102 @@
+import datetime
+from uuid import uuid4
+import pytest
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine, select
+import db.database
+from db.models import *
+from db.slow_queries import explain
+from pagination import encode_cursor, paginate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'indexes.sqlite3'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, statement) -> str:
+    """Returns the EXPLAIN QUERY PLAN of a statement as SQLite receives it."""
+    plans = []
+
+    def capture(conn, cursor, sql, parameters, context, executemany):
+        if not conn.info.get("explaining"):
+            conn.info["explaining"] = True
+            try:
+                plans.append(explain(conn, sql, parameters))
+            finally:
+                conn.info["explaining"] = False
+
+    with engine.connect() as conn:
+        event.listen(conn, "after_cursor_execute", capture)
+        conn.execute(statement).all()
+    return "\n".join(plans[0])
+
+
+STATLINE_QUERIES = [
+    (
+        select(StatLine).where(
+            StatLine.player_id == uuid4(), StatLine.season == "2021-2022"
+        ),
+        "ix_statLines_player_id_season",
+    ),
+    (
+        select(StatLine).where(
+            StatLine.opponent == "Salisbury University",
+            StatLine.date >= datetime.date(2022, 1, 1),
+        ),
+        "ix_statLines_opponent_date",
+    ),
+    (
+        select(StatLine).where(StatLine.season == "2021-2022").order_by(StatLine.date),
+        "ix_statLines_season_date",
+    ),
+    (
+        paginate(
+            StatLine.__table__.select(),
+            StatLine,
+            encode_cursor(datetime.date(2022, 1, 1), uuid4()),
+            100,
+        ),
+        "ix_statLines_date_id",
+    ),
+]
+
+GAMESTAT_QUERIES = [
+    (
+        select(GameStat).where(GameStat.season == "2021-2022").order_by(GameStat.date),
+        "ix_gamestats_season_date",
+    ),
+    (
+        select(GameStat).where(
+            GameStat.opponent == "Salisbury University",
+            GameStat.date >= datetime.date(2022, 1, 1),
+        ),
+        "ix_gamestats_opponent_date",
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "statement, index",
+    STATLINE_QUERIES,
+    ids=["player_season", "opponent_date", "season_date", "keyset_page"],
+)
+def test_statline_queries_use_indexes(engine, statement, index):
+    assert f"USING INDEX {index}" in query_plan(engine, statement)
+
+
+def test_migration_creates_the_indexes(engine, monkeypatch):
+    # bring the database back to the schema from before the indexes were declared
+    for table in (StatLine.__table__, GameStat.__table__):
+        for index in table.indexes:
+            if not index.unique and len(index.columns) > 1:
+                index.drop(bind=engine)
+    monkeypatch.setattr(db.database, "engine", engine)
+
+    db.database.create_db_and_tables()
+
+    for statement, index in STATLINE_QUERIES + GAMESTAT_QUERIES:
+        assert f"USING INDEX {index}" in query_plan(engine, statement)
@@ -0,0 +1,11 @@
+import main
+
+
+def test_predict_an_empty_list_queues_nothing(client, monkeypatch):
+    async def predict(features):
+        raise AssertionError("an empty list reached the batcher")
+
+    monkeypatch.setattr(main.batcher, "predict", predict)
+    response = client.post("/predict/games", json=[])
+    assert response.status_code == 200
+    assert response.json() == {"predictions": []}
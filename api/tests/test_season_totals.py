@@ -0,0 +1,85 @@
+import datetime
+import pytest
+from sqlmodel import Session, select
+from db.models import *
+from db.season_totals import AVERAGE_FIELDS
+
+
+def gamestat(date: str, season: str, pts: int, **fields) -> dict:
+    """Returns the body of a game stat with every stat but the given ones set to 0."""
+    body = {
+        name: 0
+        for name, field in GameStatCreate.__fields__.items()
+        if field.type_ in (int, float) and name not in AVERAGE_FIELDS
+    }
+    body.update(date=date, season=season, opponent="Salisbury University", pts=pts)
+    body.update(fields)
+    return body
+
+
+def ppg_avg(date: str) -> float:
+    from db.database import engine
+
+    with Session(engine) as session:
+        statement = select(GameStat.ppg_avg).where(
+            GameStat.date == datetime.date.fromisoformat(date)
+        )
+        return session.exec(statement).one()
+
+
+def test_upsert_batch_counts_a_repeated_date_once(client):
+    response = client.post(
+        "/gamestats/bulk?on_conflict=update",
+        json=[
+            gamestat("2020-01-01", "2019-2020", 30),
+            gamestat("2020-01-01", "2019-2020", 10),
+        ],
+    )
+    assert response.status_code == 200
+    assert [row["status"] for row in response.json()["rows"]] == [
+        "duplicate",
+        "upserted",
+    ]
+    assert ppg_avg("2020-01-01") == 10
+
+    response = client.post("/gamestats/", json=gamestat("2020-01-02", "2019-2020", 20))
+    assert response.status_code == 200
+    assert response.json()["ppg_avg"] == pytest.approx(15)
+
+
+def test_out_of_order_insert_recomputes_later_games(client):
+    for date, pts in [("2021-01-01", 10), ("2021-01-03", 30), ("2021-01-02", 20)]:
+        response = client.post("/gamestats/", json=gamestat(date, "2020-2021", pts))
+        assert response.status_code == 200
+
+    assert ppg_avg("2021-01-01") == pytest.approx(10)
+    assert ppg_avg("2021-01-02") == pytest.approx(15)
+    assert ppg_avg("2021-01-03") == pytest.approx(20)
+
+    # The totals account for every game, so the next append is averaged off them
+    response = client.post("/gamestats/", json=gamestat("2021-01-04", "2020-2021", 40))
+    assert response.json()["ppg_avg"] == pytest.approx(25)
+
+
+def test_upsert_moving_a_game_to_another_season(client):
+    for date, season, pts in [
+        ("2022-01-01", "2021-2022", 10),
+        ("2022-01-02", "2021-2022", 20),
+        ("2022-01-03", "2022-2023", 40),
+    ]:
+        response = client.post("/gamestats/", json=gamestat(date, season, pts))
+        assert response.status_code == 200
+
+    response = client.post(
+        "/gamestats/?on_conflict=update",
+        json=gamestat("2022-01-02", "2022-2023", 20),
+    )
+    assert response.status_code == 200
+    assert response.json()["ppg_avg"] == pytest.approx(20)
+    assert ppg_avg("2022-01-03") == pytest.approx(30)
+
+    # Both seasons' totals were recomputed: the old one lost the game, the new one gained it
+    response = client.post("/gamestats/", json=gamestat("2022-01-04", "2021-2022", 30))
+    assert response.json()["ppg_avg"] == pytest.approx(20)
+    response = client.post("/gamestats/", json=gamestat("2022-01-05", "2022-2023", 60))
+    assert response.json()["ppg_avg"] == pytest.approx(40)
@@ -0,0 +1,112 @@
+from uuid import uuid4
+from fastapi import Depends, Request
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import async_engine
+from db.models import *
+
+
+# Tables whose data version is tracked, by the name the endpoints refer to them with
+VERSIONED_TABLES = ("players", "statLines", "gamestats")
+
+
+class DataVersions:
+    """Monotonically increasing data version of each table, kept in the dataVersions table.
+
+    The write endpoints bump the versions of the tables they change in their own
+    transaction, so a version is visible to every worker as soon as the write is committed
+    and never before. The versions are read from the primary by primary key, the ETags of
+    all the workers therefore agree and survive restarts. Each row has an epoch drawn when
+    it is created, so an ETag handed out before the database was recreated never matches.
+
+    On PostgreSQL the bump holds the row lock of the table's version until the write
+    commits, which serializes the writes to a table.
+    """
+
+    def create(self, session: Session):
+        """Creates the version rows of the tables that have none yet."""
+        dialect = (
+            postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+        )
+        session.execute(
+            dialect.insert(DataVersion.__table__).on_conflict_do_nothing(
+                index_elements=["table_name"]
+            ),
+            [
+                {"table_name": table, "epoch": uuid4().hex[:12], "version": 0}
+                for table in VERSIONED_TABLES
+            ],
+        )
+        session.commit()
+
+    def bump(self, session: Session, *tables: str):
+        """Bumps the versions of the tables in the session's transaction, before its commit."""
+        session.execute(
+            update(DataVersion)
+            .where(DataVersion.table_name.in_(tables))
+            .values(version=DataVersion.version + 1)
+        )
+
+    def get(self, session: Session, tables) -> tuple:
+        """Returns the (epoch, version) of each of the tables, in order."""
+        rows = session.execute(
+            select(
+                DataVersion.table_name, DataVersion.epoch, DataVersion.version
+            ).where(DataVersion.table_name.in_(tables))
+        )
+        found = {table: (epoch, version) for table, epoch, version in rows}
+        return tuple(found.get(table, ("", 0)) for table in tables)
+
+    def etag(self, tables, current: tuple) -> str:
+        """Returns the strong ETag of a response built from the tables at their versions."""
+        parts = [
+            f"{table}.{epoch}.{version}"
+            for table, (epoch, version) in zip(tables, current)
+        ]
+        return '"' + ("-".join(parts) or "static") + '"'
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag (weak comparison, as RFC 7232 asks for)."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def conditional(*tables: str):
+    """Dependency that makes a GET endpoint answer conditional requests.
+
+    It runs before the endpoint, so when the client's If-None-Match still matches the data
+    version of the tables the response is built from, NotModified is raised after a single
+    lookup of the versions and before any other query or serialization. Otherwise the ETag
+    is kept on the request state for the middleware to set on the response, and the
+    versions for the endpoint to cache its result under.
+
+    Args:
+        tables (str): names of the tables the endpoint's response is built from
+    """
+
+    async def check_etag(request: Request):
+        current = ()
+        if tables:
+            async with AsyncSession(async_engine) as session:
+                current = await session.run_sync(versions.get, tables)
+        request.state.versions = current
+        etag = versions.etag(tables, current)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            raise NotModified(etag)
+        request.state.etag = etag
+
+    return Depends(check_etag)
+
+
+versions = DataVersions()